@@ -2,6 +2,7 @@ import { Request, Response } from 'express';
 import axios from 'axios';
 import prisma from '../lib/prisma';
 import logger from '../utils/logger';
+import { resolveLlmTenant, llmTenantHeaders } from '../utils/llmTenant';
 
 // Environment variable for the LLM service URL
 const LLM_SERVICE_URL = process.env.LLM_SERVICE_URL || 'http://localhost:5000';
@@ -74,7 +75,9 @@ export const executePrompt = async (req: Request, res: Response): Promise<void>
     logger.debug('LLM Request:', llmRequest);
     
     // Call the LLM service
+    const tenant = await resolveLlmTenant(promptId, userId);
     const llmResponse = await axios.post(`${LLM_SERVICE_URL}/generate`, llmRequest, {
+      headers: llmTenantHeaders(tenant),
       timeout: 60000 // 60 second timeout
     });
     
@@ -205,7 +208,7 @@ export const executePrompt = async (req: Request, res: Response): Promise<void>
 // Optimize a prompt using AI-powered self-supervised optimization
 export const optimizePrompt = async (req: Request, res: Response): Promise<void> => {
   try {
-    const { prompt, instructions, model, temperature, max_tokens } = req.body;
+    const { promptId, prompt, instructions, model, temperature, max_tokens } = req.body;
     const userId = req.user?.id;
     
     // Validate required fields
@@ -240,7 +243,9 @@ export const optimizePrompt = async (req: Request, res: Response): Promise<void>
     logger.debug('Optimization Request:', optimizationRequest);
     
     // Call the LLM service optimization endpoint
+    const tenant = await resolveLlmTenant(promptId, userId);
     const optimizationResponse = await axios.post(`${LLM_SERVICE_URL}/optimize-prompt`, optimizationRequest, {
+      headers: llmTenantHeaders(tenant),
       timeout: 180000 // 3 minute timeout for optimization (increased due to response generation)
     });
     
@@ -1,6 +1,7 @@
 import { Request, Response } from 'express';
 import prisma from '../lib/prisma';
 import logger from '../utils/logger';
+import { resolveLlmTenant, llmTenantHeaders } from '../utils/llmTenant';
 import { Prisma } from '@prisma/client';
 import axios from 'axios';
 // Get prompt by ID
@@ -700,7 +701,9 @@ export const mergeMergeRequest = async (req: Request, res: Response): Promise<vo
 
              try {
          // Call the LLM service to get real metrics
+         const tenant = await resolveLlmTenant(mr.prompt_id, userId);
          const llmResponse = await axios.post(`${LLM_SERVICE_URL}/generate`, llmRequest, {
+          headers: llmTenantHeaders(tenant),
           timeout: 30000 // 30 second timeout
         });
 
@@ -51,6 +51,7 @@ router.post(
   '/optimize',
   authenticate,
   [
+    body('promptId').optional().isUUID(4).withMessage('Invalid prompt ID'),
     body('prompt').notEmpty().withMessage('Prompt content is required'),
     body('instructions').notEmpty().withMessage('Optimization instructions are required'),
     body('model').optional().isString().withMessage('Model must be a string'),
@@ -0,0 +1,35 @@
+import prisma from '../lib/prisma';
+
+// Header the LLM service uses to attribute rate limits, quotas and usage to a tenant
+export const LLM_TENANT_HEADER = 'X-Organization-Id';
+
+/**
+ * Tenant for LLM service calls. Usage is charged to the organization that owns
+ * the prompt's repository only when the caller is that organization's owner or
+ * a member; everything else is charged to the caller.
+ */
+export const resolveLlmTenant = async (
+  promptId?: string | null,
+  userId?: string | null
+): Promise<string | null> => {
+  if (promptId && userId) {
+    const prompt = await prisma.prompt.findUnique({
+      where: { id: promptId },
+      select: { repository: { select: { owner_org_id: true } } }
+    });
+    const orgId = prompt?.repository?.owner_org_id;
+    if (orgId) {
+      const [org, membership] = await Promise.all([
+        prisma.organization.findUnique({ where: { id: orgId }, select: { owner_id: true } }),
+        prisma.orgMembership.findFirst({ where: { org_id: orgId, user_id: userId } })
+      ]);
+      if (org?.owner_id === userId || membership) {
+        return `org:${orgId}`;
+      }
+    }
+  }
+  return userId ? `user:${userId}` : null;
+};
+
+export const llmTenantHeaders = (tenant: string | null): Record<string, string> =>
+  tenant ? { [LLM_TENANT_HEADER]: tenant } : {};
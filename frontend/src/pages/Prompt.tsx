@@ -1253,6 +1253,7 @@ const Prompt: React.FC = () => {
       setError(null);
       
       const optimizationData = {
+        promptId,
         prompt: editedContent,
         instructions: optimizerForm.instructions,
         temperature: parameters.temperature,
@@ -165,6 +165,7 @@ class PromptService {
 
   // Optimize a prompt using AI-powered self-supervised optimization
   async optimizePrompt(data: {
+    promptId?: string;
     prompt: string;
     instructions: string;
     model?: string;
@@ -1,10 +1,40 @@
 import os
-from flask import Flask, request, jsonify
+import functools
+import hmac
+from flask import Flask, Response, request, jsonify, g
 from dotenv import load_dotenv
 import requests
 import logging
 import time
 
+from optimization_strategies import OptimizationContext, STRATEGIES, OVERRIDABLE_STAGES, build_strategy
+from prompt_compression import PromptCompressor
+from scheduler import (
+    PriorityScheduler,
+    SchedulerBusy,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_OPTIMIZATION,
+    PRIORITY_BATCH
+)
+from rate_limit import ANONYMOUS_TENANT_PREFIX, TenantLimiter, create_store
+from providers import GeminiAdapter, OpenAICompatibleAdapter, is_model_failure, is_retryable
+from model_router import ModelRouter, ROUTING_MODES, ROUTING_REQUESTED
+from service_config import ConfigStore, ConfigError
+from transport import install_json_provider, install_compression
+from health import HealthMonitor
+from usage_ledger import UsageLedger, STATUS_OK, STATUS_ERROR
+from memory_budget import MemoryBudget, MemoryBusy, estimate_optimization_bytes, truncate_text, preview
+from profiling import (
+    InflightRequests,
+    ProfilerBusy,
+    cpu_profile,
+    memory_profile,
+    render_folded,
+    thread_stacks,
+    render_thread_stacks
+)
+from werkzeug.exceptions import RequestEntityTooLarge
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -16,156 +46,531 @@ app = Flask(__name__)
 
 load_dotenv()
 
+# Request/response transport: body size limit, negotiated compression and orjson when available
+TRANSPORT_CONFIG = {
+    "MAX_REQUEST_BYTES": int(os.getenv("MAX_REQUEST_BYTES", str(2 * 1024 * 1024))),
+    "COMPRESSION": {
+        "ENABLED": os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true",
+        "MIN_SIZE_BYTES": int(os.getenv("COMPRESSION_MIN_SIZE_BYTES", "1024")),
+        "GZIP_LEVEL": 5,
+        "BROTLI_QUALITY": 4
+    }
+}
+
+app.config["MAX_CONTENT_LENGTH"] = TRANSPORT_CONFIG["MAX_REQUEST_BYTES"]
+install_json_provider(app)
+install_compression(app, TRANSPORT_CONFIG["COMPRESSION"])
+
 # Set your Gemini API key as an environment variable or hardcode temporarily (not for production)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "YOUR_API_KEY_HERE")
 
 # Gemini 1.5 Flash endpoint
 GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
 
-# Available models
-MODEL_REGISTRY = {
-    "gemini-1.5-flash": {
-        "name": "Gemini 1.5 Flash",
-        "description": "Google's fast multimodal model with great performance for diverse tasks",
-        "default_parameters": {
-            "temperature": 0.7,
-            "top_p": 1.0,
-            "max_tokens": 128,
-            "frequency_penalty": 0.0
+# Model used when a request names none; every loaded config must register it
+DEFAULT_MODEL_ID = "gemini-1.5-flash"
+
+# Largest output budget the optimizer asks for on a single call
+UPSTREAM_MAX_TOKENS = 2048
+
+# Adapters keyed by the "provider" field of model registry entries
+PROVIDER_ADAPTERS = {
+    "Google": GeminiAdapter(GEMINI_API_KEY),
+    "OpenAI": OpenAICompatibleAdapter()
+}
+
+router = ModelRouter()
+
+def validate_strategies(config):
+    """Reject configs whose strategy defaults would break /optimize-prompt"""
+    if config.optimization["DEFAULT_STRATEGY"] not in STRATEGIES:
+        raise ConfigError(f"optimization.DEFAULT_STRATEGY '{config.optimization['DEFAULT_STRATEGY']}' is not a known strategy")
+    for name in STRATEGIES:
+        build_strategy(name, {}, config.optimization)
+
+def validate_default_model(config):
+    """Reject configs that drop the model requests fall back to"""
+    if DEFAULT_MODEL_ID not in config.models:
+        raise ConfigError(f"model_registry must contain the default model '{DEFAULT_MODEL_ID}'")
+
+# Model registry, optimization config and prompt templates live in a watched config file;
+# every request works on the snapshot that was current when it started (g.config)
+CONFIG_PATH = os.getenv("PROMPTLAB_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "service_config.json"))
+config_store = ConfigStore(CONFIG_PATH, PROVIDER_ADAPTERS, validators=[validate_strategies, validate_default_model])
+
+CONFIG_WATCH_INTERVAL_S = float(os.getenv("CONFIG_WATCH_INTERVAL_S", "2"))
+if CONFIG_WATCH_INTERVAL_S > 0:
+    config_store.start_watcher(CONFIG_WATCH_INTERVAL_S)
+
+# Upstream scheduling: priority classes share MAX_CONCURRENCY slots, each with its own reservation
+SCHEDULER_CONFIG = {
+    "MAX_CONCURRENCY": int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "8")),
+    "CLASSES": {
+        PRIORITY_INTERACTIVE: {
+            "weight": 8,              # Playground /generate calls
+            "reserved": 2,
+            "max_queue": 64,
+            "queue_timeout_s": 15
         },
-        "endpoint": "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent",
-        "provider": "Google",
-        "capabilities": ["text-generation", "chat", "multimodal"],
-        "cost": {
-            "input_per_1k": 10.25,
-            "output_per_1k": 30.75
-        }
-    },
-    "gemini-0.5-flash": {
-        "name": "Gemini 0.5 Flash",
-        "description": "Google's fast multimodal model with great performance for diverse tasks",
-        "default_parameters": {
-            "temperature": 0.7,
-            "top_p": 1.0,
-            "max_tokens": 256,
-            "frequency_penalty": 0.0
+        PRIORITY_OPTIMIZATION: {
+            "weight": 3,              # Individual calls of an /optimize-prompt run
+            "reserved": 1,
+            "max_queue": 256,
+            "queue_timeout_s": 60
         },
-        "endpoint": "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent",
-        "provider": "Google",
-        "capabilities": ["text-generation", "chat", "multimodal"],
-        "cost": {
-            "input_per_1k": 0.000125,
-            "output_per_1k": 0.000375
+        PRIORITY_BATCH: {
+            "weight": 1,              # Bulk / offline workloads
+            "reserved": 0,
+            "max_queue": 1024,
+            "queue_timeout_s": 300
         }
     }
 }
 
-# Optimization Constants
-OPTIMIZATION_CONFIG = {
-    "DEFAULT_ITERATIONS": 2,
-    "DEFAULT_CANDIDATES_PER_ROUND": 2,
-    "DEFAULT_MAX_TOKENS": 500,
-    "TOKEN_LIMITS": {
-        "CANDIDATE_GENERATION": 400,  # Enough for improved prompt without bloating
-        "EVALUATION": 150,            # Concise evaluation with score and reasoning
-        "REFINEMENT": 450,           # Allow for thoughtful refinement
-        "FINAL_EVALUATION": 200      # Comprehensive final assessment
+scheduler = PriorityScheduler(SCHEDULER_CONFIG["MAX_CONCURRENCY"], SCHEDULER_CONFIG["CLASSES"])
+
+# Per-tenant limits. The backend identifies the calling organization via TENANT_HEADER;
+# bucket units are upstream calls, so an optimization is charged its expected call count.
+# Requests without the header are limited per caller address and skip the quotas.
+RATE_LIMIT_CONFIG = {
+    "ENABLED": os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true",
+    "TENANT_HEADER": os.getenv("RATE_LIMIT_TENANT_HEADER", "X-Organization-Id"),
+    "STORE": os.getenv("RATE_LIMIT_STORE", "memory"),  # "memory" or "sqlite:///path/to/limits.db"
+    "REQUESTS": {
+        "RATE_PER_SECOND": 2.0,
+        "BURST": 60
     },
-    "TEMPERATURE_SETTINGS": {
-        "GENERATION": 0.7,           # Creative for generating variations
-        "EVALUATION": 0.2,           # Low for consistent scoring
-        "REFINEMENT": 0.4,           # Moderate for focused improvements
-        "FINAL_EVALUATION": 0.2      # Low for objective assessment
-    },
-    "SCORE_RANGES": {
-        "ITERATION_MIN": 0,
-        "ITERATION_MAX": 40,
-        "FINAL_MIN": 0,
-        "FINAL_MAX": 10
-    }
+    # No default cost_usd quota: costs come from the placeholder rates in the model
+    # registry. Add one (e.g. {"metric": "cost_usd", "window_s": 86400, "limit": 100.0})
+    # once the registry carries real prices.
+    "QUOTAS": [
+        {"metric": "tokens", "window_s": 3600, "limit": 500000}
+    ],
+    "TENANT_OVERRIDES": {}
 }
 
-# Prompt Templates
-PROMPT_TEMPLATES = {
-    "QUALITY_INSTRUCTION": """
-Focus on quality improvements, not length. Be concise and purposeful. Do not add unnecessary content just to fill token limits.
-Ensure your response is clear, specific, and directly addresses the request.""",
-    
-    "CANDIDATE_GENERATION": """
-You are an expert prompt engineer. Your task is to improve the given prompt.
-
-Original prompt: {original_prompt}
-Optimization instructions: {optimization_instructions}
+limiter = TenantLimiter(RATE_LIMIT_CONFIG, create_store(RATE_LIMIT_CONFIG["STORE"]))
 
-Requirements:
-1. Keep the core intent and functionality of the original prompt
-2. Make it more specific, clear, and effective
-3. Ensure the improved prompt will generate better, more consistent outputs
-4. Do not make it unnecessarily long or complex
-5. Focus on quality improvements, not length — the improved prompt itself should not exceed {token_limit} tokens
-Generate an improved version of this prompt
-Important: Do not include any explanations. Only output the improved prompt.""",
-
-    "EVALUATION": """
-You are an expert prompt evaluator. Evaluate how well this prompt will perform based on the criteria below.
-
-Prompt A:
-{base_prompt}
+# Append-only record of every upstream call with incremental minute/hour/day rollups
+USAGE_LEDGER_CONFIG = {
+    "ENABLED": os.getenv("USAGE_LEDGER_ENABLED", "true").lower() == "true",
+    "PATH": os.getenv("USAGE_LEDGER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "usage_ledger.db")),
+    "BATCH_SIZE": 500,
+    "FLUSH_INTERVAL_S": 1.0,
+    "MAX_QUEUE": 10000,
+    "MINUTE_RETENTION_DAYS": 7
+}
 
-Prompt A Response:
-{base_prompt_response}
+usage_ledger = UsageLedger(USAGE_LEDGER_CONFIG["PATH"], USAGE_LEDGER_CONFIG) if USAGE_LEDGER_CONFIG["ENABLED"] else None
+
+# Size caps that keep per-request and per-worker memory predictable
+MEMORY_CONFIG = {
+    "MAX_PROMPT_CHARS": int(os.getenv("MAX_PROMPT_CHARS", "100000")),
+    "MAX_INSTRUCTIONS_CHARS": int(os.getenv("MAX_INSTRUCTIONS_CHARS", "10000")),
+    "MAX_RESPONSE_CHARS": int(os.getenv("MAX_RESPONSE_CHARS", "65536")),
+    "MAX_OPTIMIZATION_BYTES": int(os.getenv("MAX_OPTIMIZATION_BYTES", str(16 * 1024 * 1024))),
+    "MAX_TOTAL_OPTIMIZATION_BYTES": int(os.getenv("MAX_TOTAL_OPTIMIZATION_BYTES", str(256 * 1024 * 1024))),
+    "CHARS_PER_TOKEN": 4,
+    # Headroom over CHARS_PER_TOKEN in the memory estimate. Output is never cut to the
+    # estimate; only the upstream max_tokens and MAX_RESPONSE_CHARS bound it.
+    "ESTIMATE_SAFETY_FACTOR": 2.0,
+    "LOG_PREVIEW_CHARS": 200
+}
 
-Prompt B:
-{candidate_prompt}
+memory_budget = MemoryBudget(MEMORY_CONFIG["MAX_TOTAL_OPTIMIZATION_BYTES"])
 
-Prompt B Response:
-{candidate_prompt_response}
+# Admin token for the /admin/profile endpoints and the cross-tenant /usage report;
+# those endpoints are disabled while no token is set
+PROFILING_CONFIG = {
+    "ADMIN_TOKEN": os.getenv("PROFILING_ADMIN_TOKEN", ""),
+    "MAX_SECONDS": 60,
+    "SAMPLE_INTERVAL_MS": 10
+}
 
-Optimization goal: {optimization_instructions}
+inflight_requests = InflightRequests()
+
+# Readiness is computed in the background from router/scheduler state plus idle-model probes
+HEALTH_CONFIG = {
+    "ENABLED": os.getenv("HEALTH_MONITOR_ENABLED", "true").lower() == "true",
+    "REFRESH_INTERVAL_S": float(os.getenv("HEALTH_REFRESH_INTERVAL_S", "5")),
+    "PROBE_INTERVAL_S": 60,
+    "PROBE_TIMEOUT_S": 5,
+    "MAX_ERROR_RATE": 0.5,
+    "MAX_LATENCY_MS": 30000,
+    "MAX_QUEUE_DEPTH": int(os.getenv("HEALTH_MAX_QUEUE_DEPTH", "32"))
+}
 
-Evaluation criteria:
-1. Clarity and specificity
-2. Likelihood to produce consistent outputs
-3. Effectiveness for the intended use case
+health_monitor = HealthMonitor(HEALTH_CONFIG, router, scheduler, config_store, PROVIDER_ADAPTERS)
+if HEALTH_CONFIG["ENABLED"]:
+    health_monitor.start()
+
+@app.before_request
+def bind_config():
+    g.config = config_store.current()
+
+@app.before_request
+def parse_request_body():
+    """Enforce the body size limit and decode JSON once, before any view touches the body"""
+    if request.method != "POST":
+        return None
+    # Reading raises RequestEntityTooLarge for declared and chunked bodies alike
+    request.get_data(cache=True)
+    if request.is_json and request.get_json(silent=True) is None and request.get_data():
+        return jsonify({"status": "error", "error": "Request body is not valid JSON"}), 400
+    return None
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({
+        "status": "error",
+        "error": f"Request body exceeds {TRANSPORT_CONFIG['MAX_REQUEST_BYTES']} bytes"
+    }), 413
+
+@app.after_request
+def add_config_version_header(response):
+    config = getattr(g, "config", None)
+    if config is not None:
+        response.headers["X-Config-Version"] = config.version
+    return response
+
+@app.route('/config', methods=['GET'])
+def config_status():
+    """Version and origin of the active configuration"""
+    return jsonify({
+        **g.config.describe(),
+        "last_reload_error": config_store.last_error
+    })
 
-Only output the winning prompt as: "WINNER: A" or "WINNER: B"
-""",
-    
-    "REFINEMENT": """You are an expert prompt engineer. Take this already-good prompt and make subtle refinements to make it even better.
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health check endpoint"""
+    return jsonify({'status': 'healthy', 'service': 'promptlab-service'})
 
-Current prompt: {current_prompt}
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness: the process serves requests and its background health refresher is running"""
+    if not health_monitor.is_alive():
+        return jsonify({'status': 'unhealthy', 'service': 'promptlab-service', 'reason': 'health monitor stopped'}), 503
+    return jsonify({'status': 'alive', 'service': 'promptlab-service', 'uptime_s': round(time.time() - health_monitor.started_at)})
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Readiness from the cached upstream health snapshot; never calls the upstream itself"""
+    snapshot = health_monitor.snapshot()
+    body = {
+        'status': 'ready' if snapshot['ready'] else 'not_ready',
+        'service': 'promptlab-service',
+        'snapshot_age_s': round(time.time() - snapshot['checked_at'], 1),
+        **snapshot
+    }
+    if request.args.get('verbose') not in ('1', 'true'):
+        body.pop('models')
+    return jsonify(body), 200 if snapshot['ready'] else 503
+
+@app.before_request
+def track_inflight_request():
+    inflight_requests.begin(request.endpoint, request.path, request.headers.get(RATE_LIMIT_CONFIG["TENANT_HEADER"]))
+
+@app.teardown_request
+def untrack_inflight_request(exc):
+    inflight_requests.end()
+
+def require_admin():
+    """None when the caller holds the admin token, otherwise the error response"""
+    token = PROFILING_CONFIG["ADMIN_TOKEN"]
+    if not token:
+        return jsonify({"error": "Admin endpoints are disabled; set PROFILING_ADMIN_TOKEN to enable them"}), 404
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), token):
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+def profile_seconds():
+    seconds = float(request.args.get("seconds", "10"))
+    if not 0 < seconds <= PROFILING_CONFIG["MAX_SECONDS"]:
+        raise ValueError(f"'seconds' must be between 0 and {PROFILING_CONFIG['MAX_SECONDS']}")
+    return seconds
 
-Optimization goal: {optimization_instructions}
+"""
+    Sample every thread's stack for N seconds.
 
-Make small, targeted improvements such as:
-- Better word choices
-- Clearer instructions
-- More specific guidance
-- Better structure or formatting
+    Query parameters:
+        seconds       # optional, default 10
+        interval_ms   # optional sampling interval, default 10
+        requests_only # optional, only sample threads serving a request
 
-Focus on quality over quantity. Do not unnecessarily expand the prompt.
+    Returns folded stacks (text/plain, "frame;frame;frame samples" per line)
+    for flamegraph.pl, inferno or speedscope.
+    """
+@app.route('/admin/profile/cpu', methods=['POST'])
+def profile_cpu():
+    denied = require_admin()
+    if denied:
+        return denied
+    try:
+        seconds = profile_seconds()
+        interval_s = float(request.args.get("interval_ms", PROFILING_CONFIG["SAMPLE_INTERVAL_MS"])) / 1000
+        if interval_s <= 0:
+            raise ValueError("'interval_ms' must be positive")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    logger.info(f"CPU profile requested for {seconds}s")
+    try:
+        samples = cpu_profile(inflight_requests, seconds, interval_s, request.args.get("requests_only") in ("1", "true"))
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    return Response(
+        render_folded(samples),
+        mimetype="text/plain",
+        headers={"Content-Disposition": f"attachment; filename=cpu-{int(time.time())}.folded"}
+    )
 
-Output only the refined prompt (no explanations):""",
-    
-    "FINAL_EVALUATION": """Reflect on the original prompt and the final improved prompt. Did the improvement meet the instructions below?
+"""
+    Trace allocations for N seconds and report the top allocators.
 
-Original: {base_prompt}
+    Query parameters:
+        seconds   # optional, default 10
+        top       # optional, number of lines per list, default 25
+        format    # optional: json (top allocators and growth) | folded (tracebacks weighted by bytes)
+    """
+@app.route('/admin/profile/memory', methods=['POST'])
+def profile_memory():
+    denied = require_admin()
+    if denied:
+        return denied
+    output_format = request.args.get("format", "json")
+    if output_format not in ("json", "folded"):
+        return jsonify({"error": "'format' must be json or folded"}), 400
+    try:
+        seconds = profile_seconds()
+        top = int(request.args.get("top", "25"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    logger.info(f"Memory profile requested for {seconds}s")
+    try:
+        report, folded = memory_profile(seconds, top)
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    if output_format == "folded":
+        return Response(
+            render_folded(folded),
+            mimetype="text/plain",
+            headers={"Content-Disposition": f"attachment; filename=memory-{int(time.time())}.folded"}
+        )
+    return jsonify(report)
 
-Final: {final_prompt}
+"""
+    Current stacks of threads serving requests, oldest first.
 
-Instructions: {optimization_instructions}
+    Query parameters:
+        all     # optional, include every endpoint instead of only generate / optimize_prompt
+        format  # optional: json | text (Python traceback layout)
+    """
+@app.route('/admin/threads', methods=['GET'])
+def dump_threads():
+    denied = require_admin()
+    if denied:
+        return denied
+    endpoints = None if request.args.get("all") in ("1", "true") else ("generate", "optimize_prompt")
+    threads = [
+        thread for thread in thread_stacks(inflight_requests, endpoints)
+        if thread["endpoint"] != request.endpoint
+    ]
+    if request.args.get("format") == "text":
+        return Response(render_thread_stacks(threads), mimetype="text/plain")
+    return jsonify({"threads": threads})
+
+def check_text_size(name, text, limit, start_time):
+    """413 response when a text field is over its configured size, otherwise None"""
+    if isinstance(text, str) and len(text) > limit:
+        return jsonify({
+            "status": "error",
+            "error": f"'{name}' is {len(text)} characters, limit is {limit}",
+            "metrics": {
+                "processing_time_ms": round((time.time() - start_time) * 1000)
+            }
+        }), 413
+    return None
+
+@app.route('/metrics/memory', methods=['GET'])
+def memory_metrics():
+    """Worker-wide optimization memory reservations and the configured caps"""
+    return jsonify({**memory_budget.metrics(), "limits": MEMORY_CONFIG})
+
+@app.route('/metrics/scheduler', methods=['GET'])
+def scheduler_metrics():
+    """Per-class upstream concurrency and queue-wait metrics"""
+    return jsonify(scheduler.metrics())
+
+def scheduler_busy_response(e, start_time, **extra):
+    """503 response for requests that could not get an upstream slot or memory reservation"""
+    response = jsonify({
+        "status": "error",
+        **extra,
+        "error": str(e),
+        "metrics": {
+            "processing_time_ms": round((time.time() - start_time) * 1000)
+        }
+    })
+    response.headers["Retry-After"] = str(e.retry_after_s)
+    return response, 503
+
+def get_tenant_id():
+    """Tenant identity set by the backend, falling back to the caller address"""
+    tenant_id = request.headers.get(RATE_LIMIT_CONFIG["TENANT_HEADER"], "").strip()
+    return tenant_id or f"{ANONYMOUS_TENANT_PREFIX}{request.remote_addr}"
+
+def enforce_rate_limit(tenant_id, units, start_time, **extra):
+    """Returns a 429 response when the tenant is over a limit, otherwise None"""
+    if not RATE_LIMIT_CONFIG["ENABLED"]:
+        return None
+    decision = limiter.check(tenant_id, units)
+    g.rate_limit_decision = decision
+    if decision.allowed:
+        return None
+
+    logger.warning(f"Rate limit exceeded for tenant {tenant_id}: {decision.limit_type} (limit {decision.limit})")
+    response = jsonify({
+        "status": "error",
+        **extra,
+        "error": f"Rate limit exceeded ({decision.limit_type})",
+        "limit_type": decision.limit_type,
+        "retry_after_s": decision.retry_after_s,
+        "metrics": {
+            "processing_time_ms": round((time.time() - start_time) * 1000)
+        }
+    })
+    response.headers["Retry-After"] = str(decision.retry_after_s)
+    return response, 429
+
+def record_usage(tenant_id, usage):
+    """Count a completed upstream call against the tenant's rolling quotas"""
+    if RATE_LIMIT_CONFIG["ENABLED"] and tenant_id:
+        limiter.record(tenant_id, usage["tokens_input"] + usage["tokens_output"], usage["cost_usd"])
+
+@app.after_request
+def add_rate_limit_headers(response):
+    decision = getattr(g, "rate_limit_decision", None)
+    if decision is not None:
+        response.headers.extend(decision.headers())
+    return response
+
+def parse_window(value):
+    """'90', '15m', '24h' or '7d' -> seconds"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
 
-Rate this improvement 0-10 and explain why. Be honest and objective.
+"""
+    Spend, tokens and latency percentiles from the usage ledger rollups.
+    Covers every tenant, so it requires the X-Admin-Token header.
+
+    Query parameters:
+        window       # optional, e.g. 15m, 24h, 7d (default 24h); ignored when since is given
+        since, until # optional unix timestamps
+        group_by     # optional, comma separated: tenant, model, stage, bucket (default tenant,model)
+        granularity  # optional: minute | hour | day, chosen from the range when omitted
+        tenant, model
+    """
+@app.route('/usage', methods=['GET'])
+def usage_report():
+    denied = require_admin()
+    if denied:
+        return denied
+    if usage_ledger is None:
+        return jsonify({"error": "Usage ledger is disabled"}), 404
+    try:
+        until = float(request.args['until']) if 'until' in request.args else None
+        if 'since' in request.args:
+            since = float(request.args['since'])
+        else:
+            since = (until or time.time()) - parse_window(request.args.get('window', '24h'))
+    except ValueError:
+        return jsonify({"error": "'since', 'until' and 'window' must be numbers or durations like 24h"}), 400
+    group_by = [field for field in request.args.get('group_by', 'tenant,model').split(',') if field]
+    try:
+        report = usage_ledger.query(
+            since,
+            until,
+            group_by=group_by,
+            tenant=request.args.get('tenant'),
+            model=request.args.get('model'),
+            granularity=request.args.get('granularity')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({**report, "ledger": usage_ledger.stats()})
+
+@app.route('/rate-limits', methods=['GET'])
+def rate_limit_status():
+    """Current quota usage for the calling tenant"""
+    tenant_id = get_tenant_id()
+    return jsonify({
+        "tenant": tenant_id,
+        "enabled": RATE_LIMIT_CONFIG["ENABLED"],
+        "quotas": limiter.usage(tenant_id)
+    })
 
-Format:
-SCORE: [number]
-REASONING: [short explanation]"""
-}
+def estimate_usage(model, prompt, text):
+    """Word-count token estimate and cost of one upstream call"""
+    tokens_input = len(prompt.split())
+    tokens_output = len(text.split())
+    cost_input = (tokens_input / 1000) * model["cost"]["input_per_1k"]
+    cost_output = (tokens_output / 1000) * model["cost"]["output_per_1k"]
+    return {
+        "tokens_input": tokens_input,
+        "tokens_output": tokens_output,
+        "cost_input": cost_input,
+        "cost_output": cost_output,
+        "cost_usd": cost_input + cost_output
+    }
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'promptlab-service'})
+def call_model(config, model_id, prompt, params, priority, routing=ROUTING_REQUESTED,
+               stage="GENERATE", tenant_id=None, request_id=None):
+    """
+    Generate text with a registry model, falling back to equivalent models on
+    retryable upstream errors. Every attempt is written to the usage ledger.
+    Returns (text, served_model_id, usage).
+    """
+    last_error = None
+    for candidate_id in router.candidates(config.models, model_id, routing):
+        model = config.models[candidate_id]
+        adapter = PROVIDER_ADAPTERS[model["provider"]]
+        if candidate_id != model_id and not adapter.is_configured(model):
+            continue
+
+        payload = adapter.build_payload(prompt, params)
+        with scheduler.slot(priority):
+            call_start = time.time()
+            try:
+                text = adapter.send(model, payload)
+            except requests.exceptions.RequestException as e:
+                elapsed = time.time() - call_start
+                if is_model_failure(e):
+                    router.record_failure(candidate_id, elapsed)
+                if usage_ledger is not None:
+                    usage_ledger.record(tenant_id, candidate_id, stage, len(prompt.split()), 0, 0.0, elapsed * 1000,
+                                        status=STATUS_ERROR, requested_model=model_id, request_id=request_id)
+                if not is_retryable(e):
+                    raise
+                logger.warning(f"Upstream call to {candidate_id} failed ({str(e)}), trying next equivalent model")
+                last_error = e
+                continue
+            elapsed = time.time() - call_start
+            router.record_success(candidate_id, elapsed)
+
+        text, truncated = truncate_text(text, MEMORY_CONFIG["MAX_RESPONSE_CHARS"])
+        if truncated:
+            logger.warning(f"Response from {candidate_id} cut to {MEMORY_CONFIG['MAX_RESPONSE_CHARS']} characters")
+        usage = estimate_usage(model, prompt, text)
+        if usage_ledger is not None:
+            usage_ledger.record(tenant_id, candidate_id, stage, usage["tokens_input"], usage["tokens_output"],
+                                usage["cost_usd"], elapsed * 1000, status=STATUS_OK,
+                                requested_model=model_id, request_id=request_id)
+        if candidate_id != model_id:
+            logger.info(f"Request for {model_id} served by {candidate_id}")
+        return text, candidate_id, usage
+    raise last_error
 
 """List available models"""
 @app.route('/models', methods=['GET'])
@@ -173,10 +578,15 @@ def list_models():
     return jsonify({
         "models": [
             { "id": model_id, **model }
-            for model_id, model in MODEL_REGISTRY.items()
+            for model_id, model in g.config.models.items()
         ]
     })
 
+@app.route('/metrics/routing', methods=['GET'])
+def routing_metrics():
+    """Latency EWMA, error rate and circuit state per model"""
+    return jsonify({"models": router.snapshot(g.config.models)})
+
 """
     Generate text using a selected LLM model.
 
@@ -185,6 +595,8 @@ def list_models():
     {
         "model": "gemini-1.5-flash",     # optional, defaults to "gemini-1.5-flash"
         "prompt": "string",              # required
+        "routing": "requested",          # optional: requested | fastest | strict
+        "priority": "interactive",       # optional: interactive | batch (offline jobs such as dataset evaluation)
         "parameters": {                  # optional
             "temperature": float,
             "top_p": float,
@@ -199,6 +611,7 @@ def list_models():
         "status": "success",
         "output": "Generated text...",
         "model": "gemini-1.5-flash",
+        "served_by": "gemini-1.5-flash", # model that actually answered
         "metrics": {
             "processing_time_ms": int,
             "tokens_input": int,
@@ -226,10 +639,11 @@ def generate():
 
     try:
         data = request.json or {}
-        model_id = data.get("model", "gemini-1.5-flash")
+        model_id = data.get("model", DEFAULT_MODEL_ID)
+        config = g.config
 
         # Lookup model config
-        model = MODEL_REGISTRY.get(model_id)
+        model = config.models.get(model_id)
         if not model:
             return jsonify({"error": f"Model '{model_id}' not supported"}), 400
 
@@ -237,41 +651,38 @@ def generate():
         prompt = data.get("prompt")
         if not prompt:
             return jsonify({"error": "Prompt is required"}), 400
+        too_large = check_text_size("prompt", prompt, MEMORY_CONFIG["MAX_PROMPT_CHARS"], start_time)
+        if too_large:
+            return too_large
+
+        routing = data.get("routing", ROUTING_REQUESTED)
+        if routing not in ROUTING_MODES:
+            return jsonify({"error": f"Routing '{routing}' not supported. Available: {', '.join(ROUTING_MODES)}"}), 400
+
+        priority = data.get("priority", PRIORITY_INTERACTIVE)
+        if priority not in (PRIORITY_INTERACTIVE, PRIORITY_BATCH):
+            return jsonify({"error": f"Priority '{priority}' not supported. Available: {PRIORITY_INTERACTIVE}, {PRIORITY_BATCH}"}), 400
+
+        tenant_id = get_tenant_id()
+        limited = enforce_rate_limit(tenant_id, 1, start_time)
+        if limited:
+            return limited
 
         # Add quality instruction to user prompt if requested
         add_quality_instruction = data.get("add_quality_instruction", False)
         if add_quality_instruction:
-            prompt = prompt + PROMPT_TEMPLATES["QUALITY_INSTRUCTION"]
+            prompt = prompt + config.templates["QUALITY_INSTRUCTION"].text
 
         # Merge default parameters with any user-specified overrides
         params = { **model["default_parameters"], **data.get("parameters", {}) }
-        temperature = params["temperature"]
-        top_p = params["top_p"]
-        max_tokens = params["max_tokens"]
-        frequency_penalty = params["frequency_penalty"]
-
-        # Construct Gemini payload
-        payload = {
-            "contents": [{"parts": [{"text": prompt}]}],
-            "generationConfig": {
-                "temperature": temperature,
-                "topP": top_p,
-                "maxOutputTokens": max_tokens,
-                "frequencyPenalty": frequency_penalty
-            }
-        }
-
-        headers = { "Content-Type": "application/json" }
-        query_params = { "key": GEMINI_API_KEY }
 
         logger.info(f"Generating with model {model_id}")
         logger.info(f"Quality instruction added: {add_quality_instruction}")
         logger.info(f"Final prompt length: {len(prompt)} characters")
-        response = requests.post(model["endpoint"], headers=headers, params=query_params, json=payload)
-        response.raise_for_status()
-        result = response.json()
-
-        text = result["candidates"][0]["content"]["parts"][0]["text"]
+        text, served_by, usage = call_model(
+            config, model_id, prompt, params, priority, routing, tenant_id=tenant_id
+        )
+        model = config.models[served_by]
 
         # Estimate metrics
         end_time = time.time()
@@ -279,12 +690,12 @@ def generate():
         # tokens_input = len(prompt.split()) * 1.3
         # tokens_output = len(text.split()) * 1.3
 
-        tokens_input = len(prompt.split())
-        tokens_output = len(text.split())
-
-        cost_input = (tokens_input / 1000) * model["cost"]["input_per_1k"]
-        cost_output = (tokens_output / 1000) * model["cost"]["output_per_1k"]
-        total_cost = cost_input + cost_output
+        record_usage(tenant_id, usage)
+        tokens_input = usage["tokens_input"]
+        tokens_output = usage["tokens_output"]
+        cost_input = usage["cost_input"]
+        cost_output = usage["cost_output"]
+        total_cost = usage["cost_usd"]
         
         # Debug logging for cost calculation
         logger.info(f"Cost calculation: tokens_input={tokens_input}, tokens_output={tokens_output}")
@@ -295,6 +706,8 @@ def generate():
             "status": "success",
             "output": text,
             "model": model_id,
+            "served_by": served_by,
+            "config_version": config.version,
             "metrics": {
                 "processing_time_ms": processing_time_ms,
                 "tokens_input": int(tokens_input),
@@ -307,11 +720,15 @@ def generate():
             "log": [f"Generated with {model['name']}", f"Quality instruction added: {add_quality_instruction}"]
         })
 
+    except SchedulerBusy as e:
+        logger.error(f"Generation rejected by scheduler: {str(e)}")
+        return scheduler_busy_response(e, start_time)
+
     except requests.exceptions.RequestException as e:
         logger.error(f"API request failed: {str(e)}")
         return jsonify({
             "status": "error",
-            "error": f"Gemini API error: {str(e)}",
+            "error": f"Upstream API error: {str(e)}",
             "metrics": {
                 "processing_time_ms": round((time.time() - start_time) * 1000)
             }
@@ -327,30 +744,75 @@ def generate():
             }
         }), 500
 
-def call_llm(prompt_text, temp, tokens, stage_name):
+def call_llm(prompt_text, temp, tokens, stage_name, model_id=DEFAULT_MODEL_ID, priority=PRIORITY_OPTIMIZATION,
+             tenant_id=None, routing=ROUTING_REQUESTED, config=None, stage=None, request_id=None, usage_totals=None):
             """Helper function to call the LLM with specified parameters and logging"""
-            logger.info(f"Calling LLM for {stage_name} (temp={temp}, max_tokens={tokens})")
-            logger.info(f"{stage_name} prompt: '{prompt_text[:200]}{'...' if len(prompt_text) > 200 else ''}'")
+            config = config or config_store.current()
+            logger.info(f"Calling LLM for {stage_name} (model={model_id}, temp={temp}, max_tokens={tokens})")
+            logger.info(f"{stage_name} prompt: '{preview(prompt_text, MEMORY_CONFIG['LOG_PREVIEW_CHARS'])}'")
             
-            headers = { "Content-Type": "application/json" }
-            query_params = { "key": GEMINI_API_KEY }
-            payload = {
-                "contents": [{"parts": [{"text": prompt_text}]}],
-                "generationConfig": {
-                    "temperature": temp,
-                    "topP": 1.0,
-                    "maxOutputTokens": min(tokens, 2048)  # Cap at model limit
-                }
+            params = {
+                "temperature": temp,
+                "top_p": 1.0,
+                "max_tokens": min(tokens, UPSTREAM_MAX_TOKENS)  # Cap at model limit
             }
             
-            response = requests.post(MODEL_REGISTRY.get("gemini-1.5-flash")["endpoint"], headers=headers, params=query_params, json=payload)
-            response.raise_for_status()
-            result = response.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
+            text, served_by, usage = call_model(
+                config, model_id, prompt_text, params, priority, routing,
+                stage=stage or stage_name, tenant_id=tenant_id, request_id=request_id
+            )
+            result = text.strip()
+            record_usage(tenant_id, usage)
+            if usage_totals is not None:
+                for key in usage_totals:
+                    usage_totals[key] += usage[key]
             
-            logger.info(f"{stage_name} response: '{result[:200]}{'...' if len(result) > 200 else ''}'")
+            logger.info(f"{stage_name} response: '{preview(result, MEMORY_CONFIG['LOG_PREVIEW_CHARS'])}'")
             logger.info(f"{stage_name} response length: {len(result)} characters")
             return result
 
+"""List available optimization strategies with their default upstream call budgets"""
+@app.route('/optimization-strategies', methods=['GET'])
+def list_optimization_strategies():
+    optimization_config = g.config.optimization
+    return jsonify({
+        "default": optimization_config['DEFAULT_STRATEGY'],
+        "max_upstream_calls": optimization_config['MAX_UPSTREAM_CALLS'],
+        "strategies": [
+            build_strategy(name, {}, optimization_config).describe()
+            for name in STRATEGIES
+        ]
+    })
+
+"""
+    Optimize a prompt with a configurable search strategy.
+
+    === INPUT ===
+    JSON body:
+    {
+        "prompt": "string",                  # required
+        "instructions": "string",            # optional optimization goal
+        "model": "gemini-1.5-flash",         # optional
+        "temperature": float,                # optional
+        "max_tokens": int,                   # optional
+        "strategy": "greedy",                # optional: greedy | beam | successive_halving
+        "routing": "requested",              # optional: requested | fastest | strict, for non-response stages
+        "compress": bool,                    # optional, defaults to optimization COMPRESSION.ENABLED
+        "stage_models": {                    # optional per-stage model overrides
+            "EVALUATION": "gemini-1.5-flash-8b"
+        },
+        "strategy_params": {                 # optional, strategy specific
+            "iterations": int,
+            "candidates_per_round": int,     # greedy
+            "beam_width": int,               # beam
+            "candidates_per_beam": int,      # beam
+            "initial_candidates": int,       # successive_halving
+            "eta": int,                      # successive_halving
+            "refinement_rounds": int,        # any strategy, 3 calls per round
+            "final_evaluation": bool         # any strategy, 1 call
+        }
+    }
+    """
 @app.route('/optimize-prompt', methods=['POST'])
 def optimize_prompt():
     """Generate chat response using Gemini API"""
@@ -365,121 +827,143 @@ def optimize_prompt():
             return jsonify({'error': 'Prompt is required'}), 400
 
         optimization_instructions = data.get('instructions', 'Make this prompt more clear, specific, and effective')
-        model_id = data.get('model', 'gemini-1.5-flash')
+        for field, text, limit in (
+            ('prompt', data['prompt'], MEMORY_CONFIG['MAX_PROMPT_CHARS']),
+            ('instructions', optimization_instructions, MEMORY_CONFIG['MAX_INSTRUCTIONS_CHARS'])
+        ):
+            too_large = check_text_size(field, text, limit, start_time)
+            if too_large:
+                return too_large
+        model_id = data.get('model', DEFAULT_MODEL_ID)
+        config = g.config
+        optimization_config = config.optimization
         
         # Get optimization parameters with fallbacks to constants
-        temperature = data.get('temperature', OPTIMIZATION_CONFIG['TEMPERATURE_SETTINGS']['GENERATION'])
-        max_tokens = data.get('max_tokens', OPTIMIZATION_CONFIG['DEFAULT_MAX_TOKENS'])
-        
-        # Use constants for optimization configuration
-        iterations = OPTIMIZATION_CONFIG['DEFAULT_ITERATIONS']
-        candidates_per_round = OPTIMIZATION_CONFIG['DEFAULT_CANDIDATES_PER_ROUND']
+        temperature = data.get('temperature', optimization_config['TEMPERATURE_SETTINGS']['GENERATION'])
+        max_tokens = data.get('max_tokens', optimization_config['DEFAULT_MAX_TOKENS'])
 
         # Lookup model config
-        model = MODEL_REGISTRY.get(model_id)
+        model = config.models.get(model_id)
         if not model:
             logger.error(f"[{optimization_id}] Unsupported model: {model_id}")
             return jsonify({"error": f"Model '{model_id}' not supported"}), 400
-        
-        base_prompt_reponse = call_llm(
-                    data['prompt'], 
-                    temperature,
-                    max_tokens,
-                    f"Generate a base prompt response"
-                )
 
-        best_prompt = {
-            "prompt": data['prompt'],
-            "response": base_prompt_reponse
-        }
-
-        logger.info("=" * 50)
-        logger.info(f"[{optimization_id}] Starting optimization with {iterations} iterations, {candidates_per_round} candidates per round")
-        logger.info(f"[{optimization_id}] Model: {model_id}, Temperature: {temperature}, Max tokens: {max_tokens}")
-        logger.info(f"[{optimization_id}] Original prompt: '{best_prompt['prompt']}'")
-        logger.info(f"[{optimization_id}] Original prompt length: {len(best_prompt['prompt'])} characters")
-        logger.info(f"[{optimization_id}] Optimization instructions: '{optimization_instructions}'")
-
-        headers = { "Content-Type": "application/json" }
-        query_params = { "key": GEMINI_API_KEY }
-
-        for iteration in range(iterations):
-            candidates = []
-            logger.info(f"[{optimization_id}] Iteration {iteration + 1} of {iterations}")
-
-            for i in range(candidates_per_round):
-                prompt_text = PROMPT_TEMPLATES["CANDIDATE_GENERATION"].format(
-                    original_prompt=best_prompt['prompt'],
-                    optimization_instructions=optimization_instructions,
-                    token_limit=max_tokens
-                )
-                
-                candidate = call_llm(
-                    prompt_text, 
-                    temperature,
-                    max_tokens,
-                    f"candidate_generation_iter{iteration + 1}_cand{i + 1}"
-                )
-                candidate_response = call_llm(
-                    candidate, 
-                    temperature,
-                    max_tokens,
-                    f"candidate_response_iter{iteration + 1}_cand{i + 1}"
-                )
-
-                candidates.append({"prompt": candidate, "response": candidate_response})
-                
-            for i, cand in enumerate(candidates):
-                logger.info(f"[{optimization_id}] Candidate {i+1}: Prompt='{cand['prompt'][:80]}...', Response='{cand['response'][:80]}...'")
-
-            # Step 2: Evaluate candidates
-            for i, candidate in enumerate(candidates):
-                evaluation = call_llm(
-                    PROMPT_TEMPLATES["EVALUATION"].format(
-                        base_prompt=best_prompt['prompt'],
-                        base_prompt_response=best_prompt['response'],
-                        candidate_prompt=candidate['prompt'],
-                        candidate_prompt_response=candidate['response'],
-                        optimization_instructions=optimization_instructions
-                    ),
-                    temperature,
-                    max_tokens,
-                    f"candidate_evaluation_iteration{iteration + 1} -> candidate{i + 1}"
-                )
-                
-                logger.info(f"[{optimization_id}] {f"Evaluation{i}"}: '{evaluation}'")
-                winner = "A" if "WINNER: A" in evaluation else "B" if "WINNER: B" in evaluation else "A"
-                if winner == "A":
-                    logger.info(f"[{optimization_id}] Winner is base prompt")
-                elif winner == "B":
-                    logger.info(f"[{optimization_id}] Winner is candidate {i}, updating best prompt. Now best prompt is: {candidate}")
-                    best_prompt = {
-                        "prompt": candidate['prompt'],
-                        "response": candidate['response']
-                    }   
-                else:
-                    logger.info(f"[{optimization_id}] WARNING: No winner found in evaluation: '{evaluation}'")
+        if not isinstance(data.get('stage_models', {}), dict):
+            return jsonify({"error": "'stage_models' must be an object"}), 400
+        stage_models = { **optimization_config['STAGE_MODELS'], **data.get('stage_models', {}) }
+        for stage, stage_model_id in stage_models.items():
+            if stage not in OVERRIDABLE_STAGES:
+                return jsonify({"error": f"Stage '{stage}' cannot be overridden. Available: {', '.join(OVERRIDABLE_STAGES)}"}), 400
+            if stage_model_id not in config.models:
+                return jsonify({"error": f"Model '{stage_model_id}' for stage '{stage}' not supported"}), 400
+
+        routing = data.get('routing', ROUTING_REQUESTED)
+        if routing not in ROUTING_MODES:
+            return jsonify({"error": f"Routing '{routing}' not supported. Available: {', '.join(ROUTING_MODES)}"}), 400
+
+        compression_config = optimization_config.get('COMPRESSION', {})
+        if 'compress' in data:
+            if not isinstance(data['compress'], bool):
+                return jsonify({"error": "'compress' must be a boolean"}), 400
+            compression_config = { **compression_config, "ENABLED": data['compress'] }
+        compressor = PromptCompressor(compression_config)
+
+        strategy_name = data.get('strategy', optimization_config['DEFAULT_STRATEGY'])
+        try:
+            strategy = build_strategy(strategy_name, data.get('strategy_params', {}), optimization_config)
+        except ValueError as e:
+            logger.error(f"[{optimization_id}] Invalid strategy configuration: {str(e)}")
+            return jsonify({"error": str(e)}), 400
+        plan = strategy.describe()
+
+        memory_estimate = estimate_optimization_bytes(
+            strategy, data['prompt'], optimization_instructions, min(max_tokens, UPSTREAM_MAX_TOKENS),
+            optimization_config, config.templates,
+            MEMORY_CONFIG['CHARS_PER_TOKEN'] * MEMORY_CONFIG['ESTIMATE_SAFETY_FACTOR'],
+            MEMORY_CONFIG['MAX_RESPONSE_CHARS']
+        )
+        if memory_estimate > MEMORY_CONFIG['MAX_OPTIMIZATION_BYTES']:
+            logger.error(f"[{optimization_id}] Estimated memory {memory_estimate} bytes over the per-request cap")
+            return jsonify({
+                "status": "error",
+                "optimization_id": optimization_id,
+                "error": f"Optimization would hold about {memory_estimate} bytes, limit is "
+                         f"{MEMORY_CONFIG['MAX_OPTIMIZATION_BYTES']}; lower max_tokens or the number of candidates",
+                "metrics": {
+                    "processing_time_ms": round((time.time() - start_time) * 1000)
+                }
+            }), 413
+
+        tenant_id = get_tenant_id()
+        # Reserve memory before charging the tenant, so a run this worker refuses costs nothing
+        with memory_budget.reserve(memory_estimate):
+            limited = enforce_rate_limit(tenant_id, plan['expected_upstream_calls'], start_time, optimization_id=optimization_id)
+            if limited:
+                return limited
+
+            logger.info("=" * 50)
+            logger.info(f"[{optimization_id}] Starting optimization with strategy {strategy_name}: {plan}")
+            logger.info(f"[{optimization_id}] Model: {model_id}, Temperature: {temperature}, Max tokens: {max_tokens}")
+            logger.info(f"[{optimization_id}] Stage models: {stage_models}, Routing: {routing}")
+            logger.info(f"[{optimization_id}] Original prompt: '{preview(data['prompt'], MEMORY_CONFIG['LOG_PREVIEW_CHARS'])}'")
+            logger.info(f"[{optimization_id}] Original prompt length: {len(data['prompt'])} characters")
+            logger.info(f"[{optimization_id}] Optimization instructions: '{preview(optimization_instructions, MEMORY_CONFIG['LOG_PREVIEW_CHARS'])}'")
+            logger.info(f"[{optimization_id}] Estimated peak memory: {memory_estimate} bytes")
+
+            usage_totals = { "tokens_input": 0, "tokens_output": 0, "cost_usd": 0.0 }
+            ctx = OptimizationContext(
+                optimization_id,
+                data['prompt'],
+                optimization_instructions,
+                temperature,
+                max_tokens,
+                functools.partial(
+                    call_llm, tenant_id=tenant_id, config=config, request_id=optimization_id, usage_totals=usage_totals
+                ),
+                config.templates,
+                optimization_config,
+                model_id,
+                stage_models,
+                routing,
+                compressor
+            )
+            result = strategy.run(ctx)
+        best_prompt = result['best']
 
         end_time = time.time()
         processing_time_ms = round((end_time - start_time) * 1000)
         
         logger.info(f"[{optimization_id}] === PROMPT EVOLUTION RESULT ===")
-        logger.info(f"[{optimization_id}] Original prompt: '{data['prompt']}'")
-        logger.info(f"[{optimization_id}] Best prompt: '{best_prompt['prompt']}'")
+        logger.info(f"[{optimization_id}] Original prompt: '{preview(data['prompt'], MEMORY_CONFIG['LOG_PREVIEW_CHARS'])}'")
+        logger.info(f"[{optimization_id}] Best prompt: '{preview(best_prompt['prompt'], MEMORY_CONFIG['LOG_PREVIEW_CHARS'])}'")
+        logger.info(f"[{optimization_id}] Upstream calls: {ctx.upstream_calls} (expected {plan['expected_upstream_calls']})")
+        logger.info(f"[{optimization_id}] Compression: {compressor.report()}")
+        logger.info(f"[{optimization_id}] Estimated cost: ${usage_totals['cost_usd']:.6f}")
                 
         return jsonify({
             "status": "success",
             "optimization_id": optimization_id,
             "original_prompt": data['prompt'],
-            "original_response": base_prompt_reponse,
+            "original_response": result['original']['response'],
             "optimized_prompt": best_prompt['prompt'],
             "optimized_response": best_prompt['response'],
             "model": model_id,
+            "config_version": config.version,
+            "final_evaluation": result['final_evaluation'],
             "metrics": {
                 "processing_time_ms": processing_time_ms,
-                "iterations": iterations,
-                "candidates_per_iteration": candidates_per_round,
-                "total_candidates_generated": iterations * candidates_per_round,
+                "strategy": strategy_name,
+                "iterations": plan.get('iterations', 1),
+                "candidates_per_iteration": plan.get('candidates_per_round', plan.get('candidates_per_beam', plan.get('initial_candidates'))),
+                "total_candidates_generated": plan['total_candidates'],
+                "expected_upstream_calls": plan['expected_upstream_calls'],
+                "upstream_calls": ctx.upstream_calls,
+                "tokens_input": usage_totals['tokens_input'],
+                "tokens_output": usage_totals['tokens_output'],
+                "total_tokens": usage_totals['tokens_input'] + usage_totals['tokens_output'],
+                "cost_usd": round(usage_totals['cost_usd'], 6),
+                "compression": compressor.report(),
+                "memory": { "estimated_peak_bytes": memory_estimate, **ctx.memory_report() },
                 "original_length": len(data['prompt']),
                 "optimized_length": len(best_prompt['prompt']),
                 "length_change": len(best_prompt['prompt']) - len(data['prompt'])
@@ -487,12 +971,20 @@ def optimize_prompt():
             "configuration": {
                 "temperature": temperature,
                 "max_tokens": max_tokens,
-                "iterations": iterations,
-                "candidates_per_round": candidates_per_round,
+                "iterations": plan.get('iterations', 1),
+                "candidates_per_round": plan.get('candidates_per_round', plan.get('candidates_per_beam', plan.get('initial_candidates'))),
                 "token_limits": max_tokens,
-                "temperature": temperature
+                "stage_models": stage_models,
+                "routing": routing,
+                "strategy": plan
             }
         })
+    except SchedulerBusy as e:
+        logger.error(f"[{optimization_id}] Optimization rejected by scheduler: {str(e)}")
+        return scheduler_busy_response(e, start_time, optimization_id=optimization_id)
+    except MemoryBusy as e:
+        logger.error(f"[{optimization_id}] Optimization rejected, worker memory budget exhausted: {str(e)}")
+        return scheduler_busy_response(e, start_time, optimization_id=optimization_id)
     except Exception as e:
         end_time = time.time()
         processing_time_ms = round((end_time - start_time) * 1000)
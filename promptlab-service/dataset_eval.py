@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Offline prompt evaluation over a JSONL dataset.
+
+Each input line is a JSON object whose fields fill the placeholders of a
+prompt template. Every rendered prompt goes through the service's /generate
+endpoint at batch priority, so evaluation runs share upstream capacity
+without crowding out interactive traffic. They also count against the
+tenant's rate limits and appear in the usage ledger like any other call.
+
+Rows stream in and results stream out with at most --concurrency requests in
+flight. Each output line mirrors a PromptRun: input_variables, output,
+success, error_message and metrics. The output file doubles as the checkpoint.
+Re-running with the same --output skips rows that already succeeded and
+retries the failed ones. At the end of a run the file is compacted to one
+line per row, the latest attempt, in row order. Rows that render to an
+identical prompt are sent once, and the earlier result is reused.
+
+    python dataset_eval.py --template prompt.txt --input cases.jsonl --output results.jsonl
+
+A summary (throughput, latency percentiles, tokens, total cost) is printed
+at the end and written next to the output as <output>.summary.json. Rows
+carried over from the checkpoint are included, so the totals cover the whole
+dataset across resumed runs.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import time
+
+import requests
+
+from scheduler import percentile, PRIORITY_BATCH
+from service_config import CompiledTemplate, ConfigError
+
+RETRYABLE_STATUS = (429, 502, 503, 504)
+
+
+class EvaluationError(Exception):
+    """A row could not be evaluated (bad input, or the service refused it)"""
+
+
+class ServiceClient:
+    """Calls /generate on a running service, honouring Retry-After on throttling"""
+
+    def __init__(self, base_url, tenant=None, timeout_s=120, max_retries=5, pool_size=8):
+        self.base_url = base_url.rstrip("/")
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if tenant:
+            self.session.headers["X-Organization-Id"] = tenant
+
+    def generate(self, prompt, model, parameters):
+        body = {"prompt": prompt, "model": model, "parameters": parameters, "priority": PRIORITY_BATCH}
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(f"{self.base_url}/generate", json=body, timeout=self.timeout_s)
+            except requests.exceptions.RequestException as e:
+                if attempt == self.max_retries:
+                    raise EvaluationError(f"Service unreachable: {str(e)}")
+                time.sleep(min(30, 2 ** attempt))
+                continue
+            if response.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                time.sleep(float(response.headers.get("Retry-After", min(30, 2 ** attempt))))
+                continue
+            try:
+                result = response.json()
+            except ValueError:
+                raise EvaluationError(f"Service returned {response.status_code} with a non-JSON body")
+            if response.status_code != 200 or result.get("status") != "success":
+                raise EvaluationError(result.get("error") or f"Service returned {response.status_code}")
+            return result
+        raise EvaluationError("Retries exhausted")
+
+
+def read_rows(path):
+    """Yield (index, row) for every non-blank line; unparseable lines yield the error instead of a row"""
+    with open(path, "r", encoding="utf-8") as f:
+        index = 0
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError as e:
+                yield index, EvaluationError(f"Invalid JSON: {str(e)}")
+            index += 1
+
+
+def _read_records(path):
+    """Yield (record, line) for every intact line of a results file"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            yield record, line if line.endswith("\n") else line + "\n"
+
+
+def load_checkpoint(path):
+    """
+    Latest record per index and the wall time spent by the runs that wrote
+    them (run start to its last record, summed over runs).
+    """
+    latest = {}
+    runs = {}
+    if not os.path.exists(path):
+        return latest, 0.0
+    for record, _ in _read_records(path):
+        latest[record["index"]] = record
+        started_at = record.get("run_started_at")
+        if started_at is not None:
+            runs[started_at] = max(runs.get(started_at, started_at), record.get("finished_at", started_at))
+    return latest, sum(finished_at - started_at for started_at, finished_at in runs.items())
+
+
+def compact_output(path):
+    """Rewrite a results file with only the latest record per index, in index order"""
+    latest = {}
+    for record, line in _read_records(path):
+        latest[record["index"]] = line
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for index in sorted(latest):
+            f.write(latest[index])
+    os.replace(tmp_path, path)
+
+
+def prompt_key(prompt, model, parameters):
+    return hashlib.sha256(json.dumps([model, parameters, prompt], sort_keys=True).encode()).hexdigest()
+
+
+class DatasetEvaluation:
+    """Runs one template over a row stream and appends a result line per row"""
+
+    def __init__(self, client, template, model, parameters, output_path, concurrency=4, progress_every=100):
+        self.client = client
+        self.template = template
+        self.model = model
+        self.parameters = parameters
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.progress_every = progress_every
+        self.stats = {
+            "rows": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "cached": 0,
+            "skipped_from_checkpoint": 0,
+            "tokens_input": 0,
+            "tokens_output": 0,
+            "cost_usd": 0.0
+        }
+        self.latencies_ms = []
+        self.previous_elapsed_s = 0.0
+        self.run_started_at = None
+
+    def _render(self, row):
+        if isinstance(row, Exception):
+            raise row
+        if not isinstance(row, dict):
+            raise EvaluationError("Row must be a JSON object")
+        try:
+            return self.template.format(**row)
+        except KeyError as e:
+            raise EvaluationError(f"Row is missing template field {str(e)}")
+
+    def _call(self, prompt):
+        start = time.time()
+        result = self.client.generate(prompt, self.model, self.parameters)
+        return result, round((time.time() - start) * 1000)
+
+    def _record(self, index, row, key, result=None, latency_ms=None, error=None, cached=False):
+        record = {
+            "index": index,
+            "id": row.get("id") if isinstance(row, dict) else None,
+            "input_variables": row if isinstance(row, dict) else None,
+            "model": self.model,
+            "prompt_sha256": key,
+            "success": error is None,
+            "cached": cached,
+            "output": None,
+            "error_message": error,
+            "run_started_at": self.run_started_at,
+            "finished_at": time.time()
+        }
+        self.stats["rows"] += 1
+        if error is not None:
+            self.stats["failed"] += 1
+        else:
+            metrics = result.get("metrics", {})
+            record["output"] = result["output"]
+            record["served_by"] = result.get("served_by")
+            if cached:
+                # No upstream spend for a reused result
+                self.stats["cached"] += 1
+                record["metrics"] = {"latency_ms": 0, "cost_usd": 0.0, "cached_from": result.get("index")}
+            else:
+                record["metrics"] = {**metrics, "latency_ms": latency_ms}
+                self.latencies_ms.append(latency_ms)
+                self.stats["tokens_input"] += metrics.get("tokens_input", 0)
+                self.stats["tokens_output"] += metrics.get("tokens_output", 0)
+                self.stats["cost_usd"] += metrics.get("cost_usd", 0.0)
+            self.stats["succeeded"] += 1
+        return record
+
+    def _carry(self, record):
+        """Count a row that succeeded in an earlier run toward this run's totals"""
+        self.stats["rows"] += 1
+        self.stats["succeeded"] += 1
+        self.stats["skipped_from_checkpoint"] += 1
+        if record.get("cached"):
+            self.stats["cached"] += 1
+            return
+        metrics = record.get("metrics", {})
+        if metrics.get("latency_ms") is not None:
+            self.latencies_ms.append(metrics["latency_ms"])
+        self.stats["tokens_input"] += metrics.get("tokens_input", 0)
+        self.stats["tokens_output"] += metrics.get("tokens_output", 0)
+        self.stats["cost_usd"] += metrics.get("cost_usd", 0.0)
+
+    def run(self, rows):
+        previous, self.previous_elapsed_s = load_checkpoint(self.output_path)
+        cache = {}
+        for record in previous.values():
+            if record.get("success"):
+                cache.setdefault(record["prompt_sha256"], record)
+        inflight = {}   # prompt key -> future
+        waiting = {}    # prompt key -> [(index, row)] rows sharing an in-flight prompt
+        pending = {}    # future -> (index, row, key)
+        started_at = self.run_started_at = time.time()
+
+        with open(self.output_path, "a", encoding="utf-8") as out, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+
+            def write(record):
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if self.progress_every and self.stats["rows"] % self.progress_every == 0:
+                    self._progress(started_at)
+
+            def collect():
+                finished, _ = concurrent.futures.wait(list(pending), return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    index, row, key = pending.pop(future)
+                    del inflight[key]
+                    try:
+                        result, latency_ms = future.result()
+                    except EvaluationError as e:
+                        write(self._record(index, row, key, error=str(e)))
+                        for other_index, other_row in waiting.pop(key, []):
+                            write(self._record(other_index, other_row, key, error=str(e)))
+                        continue
+                    record = self._record(index, row, key, result, latency_ms)
+                    write(record)
+                    cache[key] = record
+                    for other_index, other_row in waiting.pop(key, []):
+                        write(self._record(other_index, other_row, key, record, cached=True))
+
+            for index, row in rows:
+                if index in previous and previous[index].get("success"):
+                    self._carry(previous[index])
+                    continue
+                try:
+                    prompt = self._render(row)
+                except EvaluationError as e:
+                    write(self._record(index, row, None, error=str(e)))
+                    continue
+                key = prompt_key(prompt, self.model, self.parameters)
+                if key in cache:
+                    write(self._record(index, row, key, cache[key], cached=True))
+                    continue
+                if key in inflight:
+                    waiting.setdefault(key, []).append((index, row))
+                    continue
+                # Bounded read-ahead: never hold more than one batch of rows in memory
+                while len(pending) >= self.concurrency:
+                    collect()
+                future = executor.submit(self._call, prompt)
+                inflight[key] = future
+                pending[future] = (index, row, key)
+
+            while pending:
+                collect()
+
+        compact_output(self.output_path)
+        summary = self.summary(started_at)
+        with open(f"{self.output_path}.summary.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+    def _progress(self, started_at):
+        elapsed = time.time() - started_at
+        evaluated = self.stats["rows"] - self.stats["skipped_from_checkpoint"]
+        print(
+            f"{self.stats['rows']} rows, {self.stats['failed']} failed, {self.stats['cached']} cached, "
+            f"{evaluated / elapsed if elapsed else 0:.1f} rows/s, ${self.stats['cost_usd']:.4f}",
+            file=sys.stderr
+        )
+
+    def summary(self, started_at):
+        """Totals over the whole dataset, including rows carried over from earlier runs"""
+        run_elapsed = time.time() - started_at
+        elapsed = self.previous_elapsed_s + run_elapsed
+        return {
+            **self.stats,
+            "cost_usd": round(self.stats["cost_usd"], 6),
+            "elapsed_s": round(elapsed, 3),
+            "run_elapsed_s": round(run_elapsed, 3),
+            "rows_per_second": round(self.stats["rows"] / elapsed, 3) if elapsed else None,
+            "latency_ms": {
+                "p50": percentile(self.latencies_ms, 50),
+                "p95": percentile(self.latencies_ms, 95),
+                "p99": percentile(self.latencies_ms, 99),
+                "max": max(self.latencies_ms, default=0)
+            }
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a prompt template over a JSONL dataset")
+    parser.add_argument("--template", required=True, help="file with the prompt template, {field} placeholders")
+    parser.add_argument("--input", required=True, help="JSONL file, one object of template fields per line")
+    parser.add_argument("--output", required=True, help="JSONL results file; also the resume checkpoint")
+    parser.add_argument("--model", default="gemini-1.5-flash")
+    parser.add_argument("--parameters", default="{}", help="JSON object of generation parameter overrides")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--service-url", default=os.getenv("PROMPTLAB_SERVICE_URL", "http://localhost:5000"))
+    parser.add_argument("--tenant", default=os.getenv("PROMPTLAB_TENANT"), help="sent as X-Organization-Id")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--progress-every", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    try:
+        parameters = json.loads(args.parameters)
+    except ValueError as e:
+        parser.error(f"--parameters is not valid JSON: {str(e)}")
+    if not isinstance(parameters, dict):
+        parser.error("--parameters must be a JSON object")
+    try:
+        with open(args.template, "r", encoding="utf-8") as f:
+            template = CompiledTemplate("dataset", f.read())
+    except (OSError, ConfigError) as e:
+        parser.error(f"Cannot load template: {str(e)}")
+
+    client = ServiceClient(args.service_url, args.tenant, args.timeout, pool_size=args.concurrency)
+    evaluation = DatasetEvaluation(
+        client, template, args.model, parameters, args.output, args.concurrency, args.progress_every
+    )
+    summary = evaluation.run(read_rows(args.input))
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
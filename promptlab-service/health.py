@@ -0,0 +1,141 @@
+"""
+Liveness / readiness reporting with a cached upstream health status.
+
+A daemon thread rebuilds the status every few seconds from state the
+service already keeps: router EWMAs and circuit states, and scheduler queue
+depth. Models that have seen no traffic for a while get a lightweight
+active probe, which also catches a broken API key. Probe endpoints only
+read the cached snapshot, so a load balancer polling /health/ready never
+causes an upstream call.
+"""
+
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    config: {
+        "REFRESH_INTERVAL_S": float,   # how often the snapshot is rebuilt
+        "PROBE_INTERVAL_S": float,     # idle time after which a model is actively probed
+        "PROBE_TIMEOUT_S": float,
+        "MAX_ERROR_RATE": float,       # error-rate EWMA above which a model counts as unhealthy
+        "MAX_LATENCY_MS": float,       # latency EWMA above which a model counts as unhealthy
+        "MAX_QUEUE_DEPTH": int         # queued upstream calls at which the instance reports saturated
+    }
+    """
+
+    def __init__(self, config, router, scheduler, config_store, adapters):
+        self.config = config
+        self.router = router
+        self.scheduler = scheduler
+        self.config_store = config_store
+        self.adapters = adapters
+        self.started_at = time.time()
+        self._probes = {}
+        self._snapshot = None
+        self._thread = None
+        self.refresh(probe=False)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.config["REFRESH_INTERVAL_S"])
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Health refresh failed: {str(e)}")
+
+        self._thread = threading.Thread(target=loop, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        """The refresher thread is the only moving part whose death would leave readiness stale"""
+        return self._thread is None or self._thread.is_alive()
+
+    def _probe(self, model_id, model, now):
+        """Actively check an idle model; failures are kept until the next probe"""
+        adapter = self.adapters.get(model["provider"])
+        if adapter is None:
+            return
+        previous = self._probes.get(model_id)
+        if previous and now - previous["checked_at"] < self.config["PROBE_INTERVAL_S"]:
+            return
+        try:
+            status_code = adapter.probe(model, self.config["PROBE_TIMEOUT_S"])
+            if status_code is None:
+                return
+            result = {"ok": status_code < 400, "status_code": status_code, "error": None}
+        except requests.exceptions.RequestException as e:
+            result = {"ok": False, "status_code": None, "error": str(e)}
+        result["checked_at"] = now
+        if not result["ok"]:
+            logger.warning(f"Health probe for {model_id} failed: {result}")
+        self._probes[model_id] = result
+
+    def refresh(self, probe=True):
+        now = time.time()
+        config = self.config_store.current()
+        routing = self.router.snapshot(config.models, now)
+
+        models = {}
+        for model_id, model in config.models.items():
+            stats = routing[model_id]
+            idle = stats["last_call_at"] is None or now - stats["last_call_at"] > self.config["PROBE_INTERVAL_S"]
+            if idle and probe:
+                self._probe(model_id, model, now)
+            last_probe = self._probes.get(model_id)
+
+            reasons = []
+            if stats["circuit"] == "open":
+                reasons.append("circuit open")
+            if stats["calls"] and stats["error_rate_ewma"] > self.config["MAX_ERROR_RATE"]:
+                reasons.append(f"error rate {stats['error_rate_ewma']}")
+            if stats["latency_ewma_ms"] is not None and stats["latency_ewma_ms"] > self.config["MAX_LATENCY_MS"]:
+                reasons.append(f"latency {stats['latency_ewma_ms']}ms")
+            # A failed probe only counts while no newer real traffic has succeeded
+            if last_probe and not last_probe["ok"] and (stats["last_call_at"] is None or stats["last_call_at"] < last_probe["checked_at"]):
+                reasons.append(f"probe failed ({last_probe['status_code'] or last_probe['error']})")
+
+            models[model_id] = {
+                **stats,
+                "healthy": not reasons,
+                "reasons": reasons,
+                "probe": last_probe
+            }
+
+        queue_depth = self.scheduler.queue_depth()
+        in_flight = self.scheduler.in_flight()
+        saturated = queue_depth >= self.config["MAX_QUEUE_DEPTH"]
+
+        unready = []
+        if not any(model["healthy"] for model in models.values()):
+            unready.append("no healthy upstream model")
+        if saturated:
+            unready.append(f"saturated ({queue_depth} queued upstream calls)")
+
+        self._snapshot = {
+            "ready": not unready,
+            "reasons": unready,
+            "checked_at": now,
+            "config_version": config.version,
+            "scheduler": {
+                "in_flight": in_flight,
+                "max_concurrency": self.scheduler.max_concurrency,
+                "queue_depth": queue_depth,
+                "saturated": saturated
+            },
+            "models": models
+        }
+        return self._snapshot
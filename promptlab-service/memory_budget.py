@@ -0,0 +1,104 @@
+"""
+Memory bounds for prompt optimization.
+
+An optimization holds the original prompt and response, the candidates a
+strategy keeps alive at once, and the evaluation prompt being sent. Before a
+run starts, its worst case is estimated from the strategy plan and the
+response budgets. Runs over the per-request cap are rejected outright. The
+rest reserve their estimate against a worker-wide budget, so concurrent
+optimizations cannot together exceed it.
+
+Sizes are counted in characters; for the mostly-ASCII text the service handles
+that is close to the bytes the strings occupy.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class MemoryBusy(Exception):
+    """Raised when the worker-wide optimization memory budget is fully reserved"""
+
+    def __init__(self, message, retry_after_s=5):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+def truncate_text(text, max_chars):
+    """Cut text to max_chars; returns (text, truncated)"""
+    if max_chars and len(text) > max_chars:
+        return text[:max_chars], True
+    return text, False
+
+
+def preview(text, max_chars=200):
+    """Short form of a possibly huge string for log lines"""
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... ({len(text)} characters)"
+
+
+def estimate_optimization_bytes(strategy, prompt, instructions, max_tokens, optimization_config, templates,
+                                chars_per_token, max_response_chars=None):
+    """
+    Worst-case characters an optimization keeps alive at once: the original
+    pair, the candidates the strategy holds, and the largest evaluation prompt
+    (template text plus two prompts and two responses). chars_per_token should
+    include headroom; no single output counts above max_response_chars.
+    """
+    token_limits = optimization_config["TOKEN_LIMITS"]
+
+    def output_chars(tokens):
+        chars = int(tokens * chars_per_token)
+        return min(chars, max_response_chars) if max_response_chars else chars
+
+    response_chars = output_chars(max_tokens)
+    # Candidates come from generation (max_tokens) or refinement calls
+    candidate_chars = output_chars(max(max_tokens, token_limits["REFINEMENT"]))
+    prompt_chars = max(len(prompt), candidate_chars)
+    template_chars = max(len(template.text) for template in templates.values())
+
+    original = len(prompt) + response_chars
+    candidates = strategy.peak_live_candidates() * (prompt_chars + response_chars)
+    evaluation_prompt = template_chars + len(instructions) + 2 * (prompt_chars + response_chars)
+    return original + candidates + evaluation_prompt
+
+
+class MemoryBudget:
+    """Worker-wide reservations for in-flight optimizations"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.reserved = 0
+        self.peak_reserved = 0
+        self.rejected = 0
+        self.active = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        with self._lock:
+            if self.reserved + nbytes > self.max_bytes:
+                self.rejected += 1
+                raise MemoryBusy(
+                    f"Optimization memory budget exhausted ({self.reserved} of {self.max_bytes} bytes reserved, "
+                    f"request needs {nbytes})"
+                )
+            self.reserved += nbytes
+            self.active += 1
+            self.peak_reserved = max(self.peak_reserved, self.reserved)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.reserved -= nbytes
+                self.active -= 1
+
+    def metrics(self):
+        return {
+            "max_bytes": self.max_bytes,
+            "reserved_bytes": self.reserved,
+            "peak_reserved_bytes": self.peak_reserved,
+            "active_optimizations": self.active,
+            "rejected": self.rejected
+        }
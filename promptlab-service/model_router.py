@@ -0,0 +1,139 @@
+"""
+Latency- and error-aware routing across equivalent models.
+
+Models in the registry that share a "routing_group" are interchangeable.
+The router keeps an EWMA of latency and error rate per model plus a simple
+circuit breaker, and orders the candidates a call should try.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ROUTING_REQUESTED = "requested"   # requested model first, equivalents only as fallback
+ROUTING_FASTEST = "fastest"       # healthiest / fastest equivalent first
+ROUTING_STRICT = "strict"         # requested model only, no fallback
+ROUTING_MODES = (ROUTING_REQUESTED, ROUTING_FASTEST, ROUTING_STRICT)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class _ModelStats:
+    def __init__(self):
+        self.latency_ewma_s = None
+        self.error_rate_ewma = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_call_at = None
+
+
+class ModelRouter:
+    def __init__(self, ewma_alpha=0.2, failure_threshold=5, cooldown_s=30):
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model_id):
+        stats = self._stats.get(model_id)
+        if stats is None:
+            stats = self._stats[model_id] = _ModelStats()
+        return stats
+
+    def circuit_state(self, model_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._circuit_state(self._get(model_id), now)
+
+    def _circuit_state(self, stats, now):
+        if stats.consecutive_failures < self.failure_threshold:
+            return CIRCUIT_CLOSED
+        return CIRCUIT_OPEN if now < stats.open_until else CIRCUIT_HALF_OPEN
+
+    def equivalents(self, registry, model_id):
+        group = registry[model_id].get("routing_group")
+        if not group:
+            return []
+        return [
+            other_id for other_id, other in registry.items()
+            if other_id != model_id and other.get("routing_group") == group
+        ]
+
+    def _cost(self, stats):
+        """Lower is better: expected latency inflated by the recent error rate"""
+        latency = stats.latency_ewma_s if stats.latency_ewma_s is not None else 0.0
+        return latency * (1 + 4 * stats.error_rate_ewma)
+
+    def candidates(self, registry, model_id, routing=ROUTING_REQUESTED, now=None):
+        """Ordered model ids to try; models with an open circuit go last"""
+        if routing == ROUTING_STRICT:
+            return [model_id]
+        now = time.time() if now is None else now
+        pool = [model_id] + self.equivalents(registry, model_id)
+        with self._lock:
+            ranked = []
+            for index, candidate_id in enumerate(pool):
+                stats = self._get(candidate_id)
+                is_open = self._circuit_state(stats, now) == CIRCUIT_OPEN
+                if routing == ROUTING_FASTEST:
+                    ranked.append(((is_open, self._cost(stats), index), candidate_id))
+                else:
+                    # Requested model keeps first place while its circuit is closed
+                    ranked.append(((is_open, index != 0, self._cost(stats)), candidate_id))
+        return [candidate_id for _, candidate_id in sorted(ranked)]
+
+    def record_success(self, model_id, latency_s):
+        with self._lock:
+            stats = self._get(model_id)
+            self._observe(stats, latency_s, failed=False)
+            if stats.consecutive_failures >= self.failure_threshold:
+                logger.info(f"Router: circuit for {model_id} closed")
+            stats.consecutive_failures = 0
+
+    def record_failure(self, model_id, latency_s):
+        with self._lock:
+            stats = self._get(model_id)
+            self._observe(stats, latency_s, failed=True)
+            stats.errors += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.failure_threshold:
+                stats.open_until = time.time() + self.cooldown_s
+                logger.warning(
+                    f"Router: circuit for {model_id} open for {self.cooldown_s}s "
+                    f"after {stats.consecutive_failures} consecutive failures"
+                )
+
+    def _observe(self, stats, latency_s, failed):
+        alpha = self.ewma_alpha
+        stats.calls += 1
+        stats.last_call_at = time.time()
+        if stats.latency_ewma_s is None:
+            stats.latency_ewma_s = latency_s
+        else:
+            stats.latency_ewma_s = alpha * latency_s + (1 - alpha) * stats.latency_ewma_s
+        stats.error_rate_ewma = alpha * (1.0 if failed else 0.0) + (1 - alpha) * stats.error_rate_ewma
+
+    def snapshot(self, registry, now=None):
+        now = time.time() if now is None else now
+        report = {}
+        with self._lock:
+            for model_id in registry:
+                stats = self._get(model_id)
+                report[model_id] = {
+                    "routing_group": registry[model_id].get("routing_group"),
+                    "circuit": self._circuit_state(stats, now),
+                    "latency_ewma_ms": round(stats.latency_ewma_s * 1000, 1)
+                    if stats.latency_ewma_s is not None else None,
+                    "error_rate_ewma": round(stats.error_rate_ewma, 4),
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "last_call_at": stats.last_call_at
+                }
+        return report
@@ -0,0 +1,462 @@
+"""
+Search strategies for the prompt optimizer.
+
+Every strategy drives the same LLM helpers exposed by OptimizationContext and
+declares up front how many upstream calls a run will make, so callers can
+trade result quality against latency and cost before anything is sent.
+"""
+
+import logging
+import math
+import re
+
+from model_router import ROUTING_STRICT
+from prompt_compression import PromptCompressor
+
+logger = logging.getLogger(__name__)
+
+# Smallest response budget successive halving will hand to a candidate
+MIN_RUNG_TOKENS = 32
+
+# Stages whose model can be overridden through the optimization config "STAGE_MODELS".
+# Candidate responses always run on the requested model, since that is what is being optimized.
+STAGE_RESPONSE = "RESPONSE"
+OVERRIDABLE_STAGES = ("CANDIDATE_GENERATION", "EVALUATION", "REFINEMENT", "FINAL_EVALUATION")
+
+
+class OptimizationContext:
+    """Per-request state and LLM helpers shared by every search strategy"""
+
+    def __init__(self, optimization_id, original_prompt, optimization_instructions,
+                 temperature, max_tokens, call_llm, templates, config,
+                 model_id, stage_models=None, routing=None, compressor=None):
+        self.optimization_id = optimization_id
+        self.original_prompt = original_prompt
+        self.optimization_instructions = optimization_instructions
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.templates = templates
+        self.config = config
+        self.model_id = model_id
+        self.stage_models = stage_models or {}
+        self.routing = routing
+        self.compressor = compressor or PromptCompressor({})
+        self.upstream_calls = 0
+        self.largest_prompt_chars = 0
+        self.received_chars = 0
+        self._call_llm = call_llm
+
+    def call(self, prompt_text, temp, tokens, stage_name, stage):
+        self.upstream_calls += 1
+        self.largest_prompt_chars = max(self.largest_prompt_chars, len(prompt_text))
+        if stage == STAGE_RESPONSE:
+            # Responses are what gets compared, so they must come from the model under test
+            result = self._call_llm(
+                prompt_text, temp, tokens, stage_name,
+                model_id=self.model_id, stage=stage, routing=ROUTING_STRICT
+            )
+        else:
+            kwargs = {"routing": self.routing} if self.routing else {}
+            result = self._call_llm(
+                prompt_text, temp, tokens, stage_name,
+                model_id=self.stage_models.get(stage, self.model_id),
+                stage=stage,
+                **kwargs
+            )
+        self.received_chars += len(result)
+        return result
+
+    def memory_report(self):
+        return {
+            "largest_prompt_chars": self.largest_prompt_chars,
+            "received_chars": self.received_chars
+        }
+
+    def respond(self, prompt, stage_name, tokens=None):
+        """Run a prompt the way the end user would"""
+        return self.call(prompt, self.temperature, tokens or self.max_tokens, stage_name, STAGE_RESPONSE)
+
+    def generate_candidate(self, parent_prompt, stage_name):
+        # The prompt being rewritten is passed verbatim; only evaluator input is compressed
+        prompt_text = self.templates["CANDIDATE_GENERATION"].format(
+            original_prompt=parent_prompt,
+            optimization_instructions=self.optimization_instructions,
+            token_limit=self.max_tokens
+        )
+        return self.call(prompt_text, self.temperature, self.max_tokens, stage_name, "CANDIDATE_GENERATION")
+
+    def refine(self, current_prompt, stage_name):
+        prompt_text = self.templates["REFINEMENT"].format(
+            current_prompt=current_prompt,
+            optimization_instructions=self.optimization_instructions
+        )
+        return self.call(
+            prompt_text,
+            self.config["TEMPERATURE_SETTINGS"]["REFINEMENT"],
+            self.config["TOKEN_LIMITS"]["REFINEMENT"],
+            stage_name,
+            "REFINEMENT"
+        )
+
+    def compare(self, base, candidate, stage_name):
+        """Pairwise evaluation, returns True when the candidate beats the base"""
+        evaluation = self.call(
+            self.templates["EVALUATION"].format(
+                base_prompt=self.compressor.compress(base['prompt']),
+                base_prompt_response=self.compressor.compress_response(base['response']),
+                candidate_prompt=self.compressor.compress(candidate['prompt']),
+                candidate_prompt_response=self.compressor.compress_response(candidate['response']),
+                optimization_instructions=self.optimization_instructions
+            ),
+            self.config["TEMPERATURE_SETTINGS"]["EVALUATION"],
+            self.config["TOKEN_LIMITS"]["EVALUATION"],
+            stage_name,
+            "EVALUATION"
+        )
+        logger.info(f"[{self.optimization_id}] {stage_name}: '{evaluation}'")
+        if "WINNER: B" in evaluation:
+            return True
+        if "WINNER: A" not in evaluation:
+            logger.info(f"[{self.optimization_id}] WARNING: No winner found in evaluation: '{evaluation}'")
+        return False
+
+    def score(self, candidate, stage_name):
+        """Absolute score of a candidate within the configured iteration range"""
+        ranges = self.config["SCORE_RANGES"]
+        evaluation = self.call(
+            self.templates["CANDIDATE_SCORING"].format(
+                candidate_prompt=self.compressor.compress(candidate['prompt']),
+                candidate_prompt_response=self.compressor.compress_response(candidate['response']),
+                optimization_instructions=self.optimization_instructions,
+                min_score=ranges["ITERATION_MIN"],
+                max_score=ranges["ITERATION_MAX"]
+            ),
+            self.config["TEMPERATURE_SETTINGS"]["EVALUATION"],
+            self.config["TOKEN_LIMITS"]["EVALUATION"],
+            stage_name,
+            "EVALUATION"
+        )
+        return parse_score(evaluation, ranges["ITERATION_MIN"], ranges["ITERATION_MAX"])
+
+    def final_evaluation(self, best, stage_name):
+        ranges = self.config["SCORE_RANGES"]
+        evaluation = self.call(
+            self.templates["FINAL_EVALUATION"].format(
+                base_prompt=self.compressor.compress(self.original_prompt),
+                final_prompt=self.compressor.compress(best['prompt']),
+                optimization_instructions=self.optimization_instructions
+            ),
+            self.config["TEMPERATURE_SETTINGS"]["FINAL_EVALUATION"],
+            self.config["TOKEN_LIMITS"]["FINAL_EVALUATION"],
+            stage_name,
+            "FINAL_EVALUATION"
+        )
+        reasoning = re.search(r"REASONING:\s*(.*)", evaluation, re.DOTALL)
+        return {
+            "score": parse_score(evaluation, ranges["FINAL_MIN"], ranges["FINAL_MAX"]),
+            "reasoning": reasoning.group(1).strip() if reasoning else evaluation.strip()
+        }
+
+
+def parse_score(text, min_score, max_score):
+    """Extract 'SCORE: n' from an evaluator reply, clamped to the given range"""
+    match = re.search(r"SCORE:\s*\[?(-?\d+(?:\.\d+)?)", text)
+    if not match:
+        logger.info(f"WARNING: No score found in evaluation: '{text}'")
+        return min_score
+    return max(min_score, min(max_score, float(match.group(1))))
+
+
+def _positive_int(params, key, default):
+    value = params.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"'{key}' must be a positive integer")
+    return value
+
+
+class SearchStrategy:
+    """
+    Base class for optimizer search strategies.
+
+    Subclasses implement search() and _search_calls(); the shared run() adds the
+    base response, the optional refinement phase and the optional final
+    evaluation around it.
+    """
+
+    name = None
+
+    def __init__(self, params, config):
+        self.refinement_rounds = params.get("refinement_rounds", 0)
+        if isinstance(self.refinement_rounds, bool) or not isinstance(self.refinement_rounds, int) \
+                or self.refinement_rounds < 0:
+            raise ValueError("'refinement_rounds' must be a non-negative integer")
+        self.final_evaluation = bool(params.get("final_evaluation", False))
+
+    def expected_calls(self):
+        """Number of upstream LLM calls a full run will make"""
+        return (
+            1  # base prompt response
+            + self._search_calls()
+            + self.refinement_rounds * 3
+            + (1 if self.final_evaluation else 0)
+        )
+
+    def peak_live_candidates(self):
+        """Most candidates (prompt + response) held at once, refinement included"""
+        return self._live_candidates() + (1 if self.refinement_rounds else 0)
+
+    def describe(self):
+        return {
+            "strategy": self.name,
+            "refinement_rounds": self.refinement_rounds,
+            "final_evaluation": self.final_evaluation,
+            "expected_upstream_calls": self.expected_calls()
+        }
+
+    def run(self, ctx):
+        original = {
+            "prompt": ctx.original_prompt,
+            "response": ctx.respond(ctx.original_prompt, "Generate a base prompt response")
+        }
+
+        best = self.search(ctx, original)
+
+        for round_index in range(self.refinement_rounds):
+            refined_prompt = ctx.refine(best['prompt'], f"refinement_round{round_index + 1}")
+            refined = {
+                "prompt": refined_prompt,
+                "response": ctx.respond(refined_prompt, f"refinement_response_round{round_index + 1}")
+            }
+            if ctx.compare(best, refined, f"refinement_evaluation_round{round_index + 1}"):
+                logger.info(f"[{ctx.optimization_id}] Refinement round {round_index + 1} improved the best prompt")
+                best = refined
+
+        final_evaluation = None
+        if self.final_evaluation:
+            final_evaluation = ctx.final_evaluation(best, "final_evaluation")
+
+        return {
+            "original": original,
+            "best": best,
+            "final_evaluation": final_evaluation
+        }
+
+    def search(self, ctx, original):
+        raise NotImplementedError
+
+    def _search_calls(self):
+        raise NotImplementedError
+
+    def _live_candidates(self):
+        raise NotImplementedError
+
+
+class GreedyStrategy(SearchStrategy):
+    """
+    Every candidate of a round is generated from the best prompt at the start
+    of the round, then each is compared pairwise against the running best
+    """
+
+    name = "greedy"
+
+    def __init__(self, params, config):
+        super().__init__(params, config)
+        self.iterations = _positive_int(params, "iterations", config["DEFAULT_ITERATIONS"])
+        self.candidates_per_round = _positive_int(
+            params, "candidates_per_round", config["DEFAULT_CANDIDATES_PER_ROUND"]
+        )
+
+    def _search_calls(self):
+        # generation + response + pairwise evaluation per candidate
+        return self.iterations * self.candidates_per_round * 3
+
+    def _live_candidates(self):
+        # the round's candidates plus the running best; losers are dropped right after comparison
+        return self.candidates_per_round + 1
+
+    def describe(self):
+        return {
+            **super().describe(),
+            "iterations": self.iterations,
+            "candidates_per_round": self.candidates_per_round,
+            "total_candidates": self.iterations * self.candidates_per_round
+        }
+
+    def search(self, ctx, original):
+        best = original
+        for iteration in range(self.iterations):
+            logger.info(f"[{ctx.optimization_id}] Iteration {iteration + 1} of {self.iterations}")
+            candidates = []
+            for i in range(self.candidates_per_round):
+                label = f"iter{iteration + 1}_cand{i + 1}"
+                candidate_prompt = ctx.generate_candidate(best['prompt'], f"candidate_generation_{label}")
+                candidates.append({
+                    "prompt": candidate_prompt,
+                    "response": ctx.respond(candidate_prompt, f"candidate_response_{label}")
+                })
+            for i in range(self.candidates_per_round):
+                label = f"iter{iteration + 1}_cand{i + 1}"
+                candidate = candidates.pop(0)
+                if ctx.compare(best, candidate, f"candidate_evaluation_{label}"):
+                    logger.info(f"[{ctx.optimization_id}] Candidate {label} wins, updating best prompt")
+                    best = candidate
+        return best
+
+
+class BeamSearchStrategy(SearchStrategy):
+    """Keeps the top-k scored prompts and expands each of them every iteration"""
+
+    name = "beam"
+
+    def __init__(self, params, config):
+        super().__init__(params, config)
+        defaults = config["STRATEGY_DEFAULTS"]["beam"]
+        self.iterations = _positive_int(params, "iterations", defaults["ITERATIONS"])
+        self.beam_width = _positive_int(params, "beam_width", defaults["BEAM_WIDTH"])
+        self.candidates_per_beam = _positive_int(params, "candidates_per_beam", defaults["CANDIDATES_PER_BEAM"])
+
+    def _beam_sizes(self):
+        """Beam size entering each iteration; the beam starts with the original prompt"""
+        sizes = [1]
+        for _ in range(self.iterations - 1):
+            sizes.append(min(self.beam_width, sizes[-1] * (1 + self.candidates_per_beam)))
+        return sizes
+
+    def _search_calls(self):
+        # one score for the original, then generation + response + score per child
+        return 1 + sum(size * self.candidates_per_beam * 3 for size in self._beam_sizes())
+
+    def _live_candidates(self):
+        # parents being expanded, the bounded next beam and the child being scored
+        return 2 * self.beam_width + 1
+
+    def describe(self):
+        return {
+            **super().describe(),
+            "iterations": self.iterations,
+            "beam_width": self.beam_width,
+            "candidates_per_beam": self.candidates_per_beam,
+            "total_candidates": sum(size * self.candidates_per_beam for size in self._beam_sizes())
+        }
+
+    def search(self, ctx, original):
+        beam = [{**original, "score": ctx.score(original, "beam_score_original")}]
+        for iteration in range(self.iterations):
+            logger.info(f"[{ctx.optimization_id}] Beam iteration {iteration + 1} of {self.iterations}, beam size {len(beam)}")
+            next_beam = list(beam)
+            for b, parent in enumerate(beam):
+                for i in range(self.candidates_per_beam):
+                    label = f"iter{iteration + 1}_beam{b + 1}_cand{i + 1}"
+                    candidate_prompt = ctx.generate_candidate(parent['prompt'], f"candidate_generation_{label}")
+                    candidate = {
+                        "prompt": candidate_prompt,
+                        "response": ctx.respond(candidate_prompt, f"candidate_response_{label}")
+                    }
+                    candidate["score"] = ctx.score(candidate, f"candidate_scoring_{label}")
+                    next_beam.append(candidate)
+                    # Drop whatever falls out of the top-k right away; the stable sort
+                    # keeps earlier (incumbent) prompts ahead on ties
+                    next_beam = sorted(next_beam, key=lambda cand: cand["score"], reverse=True)[:self.beam_width]
+            beam = next_beam
+            logger.info(f"[{ctx.optimization_id}] Beam scores after iteration {iteration + 1}: {[cand['score'] for cand in beam]}")
+        best = beam[0]
+        return {"prompt": best['prompt'], "response": best['response']}
+
+
+class SuccessiveHalvingStrategy(SearchStrategy):
+    """
+    Generates a wide pool of candidates, scores them on short responses and
+    only spends full response budgets on the survivors of each rung.
+    """
+
+    name = "successive_halving"
+
+    def __init__(self, params, config):
+        super().__init__(params, config)
+        defaults = config["STRATEGY_DEFAULTS"]["successive_halving"]
+        self.initial_candidates = _positive_int(params, "initial_candidates", defaults["INITIAL_CANDIDATES"])
+        self.eta = _positive_int(params, "eta", defaults["ETA"])
+        if self.eta < 2:
+            raise ValueError("'eta' must be at least 2")
+
+    def _rung_sizes(self):
+        sizes = [self.initial_candidates]
+        while sizes[-1] > 1:
+            sizes.append(math.ceil(sizes[-1] / self.eta))
+        return sizes
+
+    def _rung_tokens(self, rung, max_tokens):
+        """Response budget grows by eta per rung and reaches max_tokens on the last one"""
+        remaining = len(self._rung_sizes()) - 1 - rung
+        return min(max_tokens, max(MIN_RUNG_TOKENS, max_tokens // (self.eta ** remaining)))
+
+    def _search_calls(self):
+        # generation per candidate, response per rung entry, score per rung entry except
+        # the lone last-rung survivor (it goes straight to the final pairwise check)
+        sizes = self._rung_sizes()
+        return self.initial_candidates + 2 * sum(sizes) - sizes[-1] + 1
+
+    def _live_candidates(self):
+        # every generated prompt, plus the one response being scored
+        return self.initial_candidates + 1
+
+    def describe(self):
+        return {
+            **super().describe(),
+            "initial_candidates": self.initial_candidates,
+            "eta": self.eta,
+            "rungs": self._rung_sizes(),
+            "total_candidates": self.initial_candidates
+        }
+
+    def search(self, ctx, original):
+        survivors = [
+            {"prompt": ctx.generate_candidate(original['prompt'], f"candidate_generation_cand{i + 1}")}
+            for i in range(self.initial_candidates)
+        ]
+
+        sizes = self._rung_sizes()
+        for rung, size in enumerate(sizes):
+            tokens = self._rung_tokens(rung, ctx.max_tokens)
+            logger.info(f"[{ctx.optimization_id}] Rung {rung + 1} of {len(sizes)}: {len(survivors)} candidates, {tokens} response tokens")
+            last_rung = rung + 1 == len(sizes)
+            for i, candidate in enumerate(survivors):
+                label = f"rung{rung + 1}_cand{i + 1}"
+                candidate["response"] = ctx.respond(candidate['prompt'], f"candidate_response_{label}", tokens)
+                if last_rung:
+                    # The final survivor is judged by the pairwise check below, not by a score
+                    continue
+                candidate["score"] = ctx.score(candidate, f"candidate_scoring_{label}")
+                # Survivors get a fresh, longer response on the next rung
+                del candidate["response"]
+            if not last_rung:
+                survivors = sorted(survivors, key=lambda cand: cand["score"], reverse=True)[:sizes[rung + 1]]
+
+        winner = {"prompt": survivors[0]['prompt'], "response": survivors[0]['response']}
+        if ctx.compare(original, winner, "candidate_evaluation_final_rung"):
+            return winner
+        return original
+
+
+STRATEGIES = {
+    GreedyStrategy.name: GreedyStrategy,
+    BeamSearchStrategy.name: BeamSearchStrategy,
+    SuccessiveHalvingStrategy.name: SuccessiveHalvingStrategy
+}
+
+
+def build_strategy(name, params, config):
+    """Instantiate a strategy by name; raises ValueError for unknown names or bad params"""
+    strategy_class = STRATEGIES.get(name)
+    if not strategy_class:
+        raise ValueError(f"Strategy '{name}' not supported. Available: {', '.join(STRATEGIES)}")
+    if not isinstance(params, dict):
+        raise ValueError("'strategy_params' must be an object")
+    strategy = strategy_class(params, config)
+    max_calls = config["MAX_UPSTREAM_CALLS"]
+    if strategy.expected_calls() > max_calls:
+        raise ValueError(
+            f"Strategy '{name}' would make {strategy.expected_calls()} upstream calls, "
+            f"limit is {max_calls}"
+        )
+    return strategy
@@ -0,0 +1,204 @@
+"""
+On-demand profiling for a running worker.
+
+Nothing here runs until an admin asks for it; the only standing cost is a
+dict insert/delete per request to remember which thread serves which
+endpoint.
+
+- cpu_profile(): samples every thread's stack with sys._current_frames() for
+  a few seconds and returns folded ("collapsed") stacks. flamegraph.pl,
+  inferno and speedscope all open this format. Threads blocked on sockets
+  keep showing up in their waiting frame, so wall-clock time spent waiting
+  upstream stays visible next to JSON, logging and template work.
+- memory_profile(): runs tracemalloc for a few seconds (only if it was not
+  already tracing) and reports the top allocating lines and the growth over
+  the window, as JSON or as folded stacks weighted by bytes.
+- thread_stacks(): current stack of every thread serving a request.
+"""
+
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter
+
+
+class ProfilerBusy(Exception):
+    """Raised when another profile is already running in this worker"""
+
+
+class InflightRequests:
+    """Which thread is serving which request, for labelling stacks"""
+
+    def __init__(self):
+        self._requests = {}
+
+    def begin(self, endpoint, path, tenant=None):
+        self._requests[threading.get_ident()] = {
+            "endpoint": endpoint,
+            "path": path,
+            "tenant": tenant,
+            "started_at": time.time()
+        }
+
+    def end(self):
+        self._requests.pop(threading.get_ident(), None)
+
+    def snapshot(self):
+        return dict(self._requests)
+
+
+def _frame_label(code):
+    parts = code.co_filename.replace("\\", "/").split("/")
+    location = "/".join(parts[-2:])
+    return f"{code.co_name} ({location}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _folded_stack(frame):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _thread_root(ident, names, inflight):
+    request = inflight.get(ident)
+    if request:
+        return f"request {request['path']}"
+    return f"thread {names.get(ident, ident)}"
+
+
+_busy = threading.Lock()
+
+
+def cpu_profile(inflight, seconds, interval_s=0.01, requests_only=False):
+    """Sample all threads for `seconds`; returns {folded_stack: samples}"""
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker")
+    try:
+        own = threading.get_ident()
+        samples = Counter()
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            requests = inflight.snapshot()
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (requests_only and ident not in requests):
+                    continue
+                stack = [_thread_root(ident, names, requests)] + _folded_stack(frame)
+                samples[";".join(stack)] += 1
+            time.sleep(interval_s)
+        return samples
+    finally:
+        _busy.release()
+
+
+def render_folded(weights):
+    """One 'frame;frame;frame weight' line per stack, heaviest first"""
+    return "".join(f"{stack} {weight}\n" for stack, weight in weights.most_common())
+
+
+def _trace_label(frame):
+    parts = frame.filename.replace("\\", "/").split("/")
+    return f"{'/'.join(parts[-2:])}:{frame.lineno}".replace(";", ":")
+
+
+def memory_profile(seconds, top=25, nframes=16):
+    """
+    Trace allocations for `seconds`. Returns (report, folded) where report
+    lists the top allocating lines by current size and by growth over the
+    window, and folded maps allocation tracebacks to live bytes.
+    """
+    if not _busy.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(nframes)
+        before = tracemalloc.take_snapshot()
+        time.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _busy.release()
+
+    filters = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>")
+    )
+    before = before.filter_traces(filters)
+    after = after.filter_traces(filters)
+
+    report = {
+        "seconds": seconds,
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "top_allocators": [
+            {"location": _trace_label(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+            for stat in after.statistics("lineno")[:top]
+        ],
+        "top_growth": [
+            {
+                "location": _trace_label(stat.traceback[0]),
+                "size_diff_bytes": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size_bytes": stat.size
+            }
+            for stat in after.compare_to(before, "lineno")[:top]
+            if stat.size_diff > 0
+        ]
+    }
+
+    folded = Counter()
+    for stat in after.statistics("traceback"):
+        # tracemalloc keeps the most recent frame first
+        folded[";".join(_trace_label(frame) for frame in reversed(stat.traceback))] += stat.size
+    return report, folded
+
+
+def thread_stacks(inflight, endpoints=None):
+    """Stacks of request threads (optionally only for some endpoints), oldest request first"""
+    frames = sys._current_frames()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    now = time.time()
+    threads = []
+    for ident, request in inflight.snapshot().items():
+        if endpoints and request["endpoint"] not in endpoints:
+            continue
+        frame = frames.get(ident)
+        if frame is None:
+            continue
+        threads.append({
+            "thread_id": ident,
+            "thread_name": names.get(ident),
+            **request,
+            "age_s": round(now - request["started_at"], 3),
+            "stack": [
+                {"file": entry.filename, "line": entry.lineno, "function": entry.name, "code": entry.line}
+                for entry in traceback.extract_stack(frame)
+            ]
+        })
+    threads.sort(key=lambda thread: thread["started_at"])
+    return threads
+
+
+def render_thread_stacks(threads):
+    """Plain-text dump in the same layout as Python's own tracebacks"""
+    lines = []
+    for thread in threads:
+        lines.append(
+            f"Thread {thread['thread_id']} ({thread['thread_name']}) serving {thread['path']} "
+            f"for {thread['age_s']}s:"
+        )
+        for entry in thread["stack"]:
+            lines.append(f'  File "{entry["file"]}", line {entry["line"]}, in {entry["function"]}')
+            if entry["code"]:
+                lines.append(f"    {entry['code']}")
+        lines.append("")
+    return "\n".join(lines) + "\n"
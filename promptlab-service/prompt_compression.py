@@ -0,0 +1,110 @@
+"""
+Pre-send compression for the text embedded in optimizer prompts.
+
+Evaluation prompts embed whole candidate prompts and their responses, so
+their size grows with max_tokens. Before such a value is placed in an
+evaluator template it is cleaned up: runs of whitespace inside lines are
+collapsed (indentation is kept), repeated instruction lines are dropped, and
+long responses are cut middle-out to a token budget. Prompts sent for
+candidate generation or refinement are never compressed, since the model
+rewrites them. The start and end of a response carry most of the signal an
+evaluator needs.
+
+Token counts use the same word-split estimate as the service's usage metrics.
+"""
+
+import re
+
+# Lines shorter than this are never treated as duplicated instructions
+MIN_DEDUPE_CHARS = 20
+
+_SPACE_RUN = re.compile(r"[ \t\f\v]+")
+_INDENT = re.compile(r"^[ \t\f\v]*")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_WORD = re.compile(r"\S+")
+
+
+def count_tokens(text):
+    return len(text.split())
+
+
+def collapse_whitespace(text):
+    """Collapse space runs after the indentation, strip line ends and keep at most one blank line in a row"""
+    lines = []
+    for line in text.replace("\r\n", "\n").split("\n"):
+        indent = _INDENT.match(line).group()
+        body = _SPACE_RUN.sub(" ", line[len(indent):]).rstrip()
+        lines.append(indent + body if body else "")
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip("\n")
+
+
+def dedupe_lines(text):
+    """Drop exact repeats (case and spacing insensitive) of substantial lines"""
+    seen = set()
+    kept = []
+    for line in text.split("\n"):
+        key = " ".join(line.lower().split())
+        if len(key) >= MIN_DEDUPE_CHARS:
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def truncate_middle(text, token_budget, head_ratio=0.6):
+    """Keep the first and last words of text within token_budget, marking the cut"""
+    words = list(_WORD.finditer(text))
+    if token_budget <= 0 or len(words) <= token_budget:
+        return text
+    head = max(1, int(token_budget * head_ratio))
+    tail = max(1, token_budget - head)
+    omitted = len(words) - head - tail
+    return (
+        text[:words[head - 1].end()]
+        + f"\n[... {omitted} tokens omitted ...]\n"
+        + text[words[len(words) - tail].start():]
+    )
+
+
+class PromptCompressor:
+    """
+    Applies the configured compression steps and keeps a running tally of
+    what was saved, for reporting on the response.
+
+    config: {"ENABLED", "COLLAPSE_WHITESPACE", "DEDUPE_LINES", "RESPONSE_TOKEN_BUDGET", "HEAD_RATIO"}
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.tokens_saved = 0
+        self.chars_saved = 0
+
+    @property
+    def enabled(self):
+        return self.config.get("ENABLED", False)
+
+    def compress(self, text, token_budget=None):
+        if not self.enabled or not text:
+            return text
+        compressed = text
+        if self.config.get("COLLAPSE_WHITESPACE", True):
+            compressed = collapse_whitespace(compressed)
+        if self.config.get("DEDUPE_LINES", True):
+            compressed = dedupe_lines(compressed)
+        if token_budget:
+            compressed = truncate_middle(compressed, token_budget, self.config.get("HEAD_RATIO", 0.6))
+        self.tokens_saved += max(0, count_tokens(text) - count_tokens(compressed))
+        self.chars_saved += max(0, len(text) - len(compressed))
+        return compressed
+
+    def compress_response(self, text):
+        """Compress a model response embedded in an evaluation prompt"""
+        return self.compress(text, self.config.get("RESPONSE_TOKEN_BUDGET"))
+
+    def report(self):
+        return {
+            "enabled": self.enabled,
+            "tokens_saved": self.tokens_saved,
+            "chars_saved": self.chars_saved
+        }
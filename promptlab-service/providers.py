@@ -0,0 +1,136 @@
+"""
+Provider adapters for upstream text generation APIs.
+
+An adapter knows how to turn a prompt plus generation parameters into a
+provider-specific request and how to read the generated text back out, so the
+rest of the service can treat every model in MODEL_REGISTRY the same way.
+"""
+
+import os
+
+import requests
+
+# Used when a registry entry does not set its own timeout
+DEFAULT_TIMEOUT_S = 60
+
+
+class ProviderAdapter:
+    """Base class; subclasses implement build_payload(), request_args() and parse_text()"""
+
+    def build_payload(self, prompt, params):
+        raise NotImplementedError
+
+    def request_args(self, model):
+        """(url, headers, query_params) for a generation request against this model"""
+        raise NotImplementedError
+
+    def parse_text(self, result):
+        raise NotImplementedError
+
+    def send(self, model, payload):
+        url, headers, query_params = self.request_args(model)
+        response = requests.post(
+            url,
+            headers=headers,
+            params=query_params,
+            json=payload,
+            timeout=model.get("timeout_s", DEFAULT_TIMEOUT_S)
+        )
+        response.raise_for_status()
+        return self.parse_text(response.json())
+
+    def is_configured(self, model):
+        """Whether credentials for this model are available"""
+        return True
+
+    def probe(self, model, timeout_s):
+        """Cheap authenticated request against the model; returns the HTTP status, or None if unsupported"""
+        return None
+
+
+class GeminiAdapter(ProviderAdapter):
+    """Google Generative Language API (generateContent)"""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def build_payload(self, prompt, params):
+        generation_config = {
+            "temperature": params["temperature"],
+            "topP": params.get("top_p", 1.0),
+            "maxOutputTokens": params["max_tokens"]
+        }
+        if params.get("frequency_penalty") is not None:
+            generation_config["frequencyPenalty"] = params["frequency_penalty"]
+        return {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": generation_config
+        }
+
+    def request_args(self, model):
+        return model["endpoint"], { "Content-Type": "application/json" }, { "key": self.api_key }
+
+    def parse_text(self, result):
+        return result["candidates"][0]["content"]["parts"][0]["text"]
+
+    def is_configured(self, model):
+        return bool(self.api_key) and self.api_key != "YOUR_API_KEY_HERE"
+
+    def probe(self, model, timeout_s):
+        # Model metadata lives at the endpoint without the ":generateContent" method suffix
+        url = model["endpoint"].rsplit(":", 1)[0]
+        return requests.get(url, params={ "key": self.api_key }, timeout=timeout_s).status_code
+
+
+class OpenAICompatibleAdapter(ProviderAdapter):
+    """
+    Any /v1/chat/completions compatible API. The registry entry names the
+    upstream model in "upstream_model" and the key variable in "api_key_env".
+    """
+
+    def build_payload(self, prompt, params):
+        payload = {
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": params["temperature"],
+            "top_p": params.get("top_p", 1.0),
+            "max_tokens": params["max_tokens"]
+        }
+        if params.get("frequency_penalty") is not None:
+            payload["frequency_penalty"] = params["frequency_penalty"]
+        return payload
+
+    def request_args(self, model):
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {os.getenv(model.get('api_key_env', 'OPENAI_API_KEY'), '')}"
+        }
+        return model["endpoint"], headers, {}
+
+    def send(self, model, payload):
+        return super().send(model, {**payload, "model": model.get("upstream_model")})
+
+    def parse_text(self, result):
+        return result["choices"][0]["message"]["content"]
+
+    def is_configured(self, model):
+        return bool(os.getenv(model.get("api_key_env", "OPENAI_API_KEY")))
+
+
+def is_retryable(error):
+    """Connection problems, timeouts, throttling and server errors are worth a fallback"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+def is_model_failure(error):
+    """
+    Errors that say something about the model's health: everything retryable,
+    plus rejected credentials. Other 4xx are the caller's fault and must not
+    move the router's error rate or open its circuit.
+    """
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        if error.response.status_code in (401, 403):
+            return True
+    return is_retryable(error)
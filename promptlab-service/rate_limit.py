@@ -0,0 +1,277 @@
+"""
+Per-tenant rate limits and rolling usage quotas.
+
+Requests are charged against a token bucket (in upstream-call units) and
+against rolling token / cost windows. State lives in an in-process store with
+lock striping by default; SqliteStore shares the same state between worker
+processes on one host.
+"""
+
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Number of sub-slots a rolling quota window is split into
+QUOTA_SLOTS_PER_WINDOW = 60
+
+# Tenants identified only by caller address. Every organization reaching the
+# service through the same backend shares that address, so they get the
+# request bucket but no usage quotas.
+ANONYMOUS_TENANT_PREFIX = "ip:"
+
+
+class RateLimitDecision:
+    """Outcome of a limit check, carrying what the 429 response and headers need"""
+
+    __slots__ = ("allowed", "limit_type", "limit", "remaining", "reset_after_s")
+
+    def __init__(self, allowed, limit_type, limit, remaining, reset_after_s):
+        self.allowed = allowed
+        self.limit_type = limit_type
+        self.limit = limit
+        self.remaining = remaining
+        self.reset_after_s = reset_after_s
+
+    @property
+    def retry_after_s(self):
+        return max(1, math.ceil(self.reset_after_s))
+
+    def headers(self):
+        return {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(max(0, math.floor(self.remaining))),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after_s))
+        }
+
+
+class MemoryStore:
+    """In-process store; keys are spread over striped locks so tenants rarely contend"""
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._buckets = {}
+        self._usage = {}
+
+    def _lock(self, key):
+        return self._locks[zlib.crc32(key.encode()) % len(self._locks)]
+
+    def take(self, key, rate, burst, amount, now):
+        """Refill and try to take `amount` tokens; returns (allowed, tokens_left)"""
+        with self._lock(key):
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= amount
+            if allowed:
+                tokens -= amount
+            self._buckets[key] = (tokens, now)
+            return allowed, tokens
+
+    def add_usage(self, key, slot, amount):
+        with self._lock(key):
+            slots = self._usage.setdefault(key, deque())
+            if slots and slots[-1][0] == slot:
+                slots[-1][1] += amount
+            else:
+                slots.append([slot, amount])
+
+    def usage_since(self, key, first_slot):
+        """Per-slot usage from first_slot onwards, oldest first; older slots are dropped"""
+        with self._lock(key):
+            slots = self._usage.get(key)
+            if not slots:
+                return []
+            while slots and slots[0][0] < first_slot:
+                slots.popleft()
+            return [(slot, amount) for slot, amount in slots]
+
+
+class SqliteStore:
+    """Store backed by a local SQLite file so several worker processes share limits"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_usage ("
+            "key TEXT NOT NULL, slot INTEGER NOT NULL, amount REAL NOT NULL, "
+            "PRIMARY KEY (key, slot))"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, amount, now):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+            allowed = tokens >= amount
+            if allowed:
+                tokens -= amount
+            conn.execute(
+                "INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+    def add_usage(self, key, slot, amount):
+        self._conn().execute(
+            "INSERT INTO rate_usage (key, slot, amount) VALUES (?, ?, ?) "
+            "ON CONFLICT(key, slot) DO UPDATE SET amount = amount + excluded.amount",
+            (key, slot, amount)
+        )
+
+    def usage_since(self, key, first_slot):
+        conn = self._conn()
+        conn.execute("DELETE FROM rate_usage WHERE key = ? AND slot < ?", (key, first_slot))
+        return conn.execute(
+            "SELECT slot, amount FROM rate_usage WHERE key = ? AND slot >= ? ORDER BY slot",
+            (key, first_slot)
+        ).fetchall()
+
+
+def create_store(spec):
+    """'memory' or 'sqlite:///path/to/limits.db'"""
+    if not spec or spec == "memory":
+        return MemoryStore()
+    if spec.startswith("sqlite:///"):
+        path = spec[len("sqlite:///"):]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SqliteStore(path)
+    raise ValueError(f"Unsupported rate limit store '{spec}'")
+
+
+class TenantLimiter:
+    """
+    Token-bucket request limiting plus rolling quotas, keyed by tenant.
+
+    config:
+        {
+            "REQUESTS": {"RATE_PER_SECOND": float, "BURST": float},
+            "QUOTAS": [{"metric": "tokens" | "cost_usd", "window_s": int, "limit": float}, ...],
+            "TENANT_OVERRIDES": {tenant_id: {"REQUESTS": {...}, "QUOTAS": [...]}}
+        }
+
+    Anonymous tenants (ANONYMOUS_TENANT_PREFIX) are never held to quotas.
+    """
+
+    def __init__(self, config, store):
+        self.config = config
+        self.store = store
+
+    def _limits(self, tenant_id):
+        override = self.config.get("TENANT_OVERRIDES", {}).get(tenant_id, {})
+        if tenant_id.startswith(ANONYMOUS_TENANT_PREFIX):
+            return override.get("REQUESTS", self.config["REQUESTS"]), []
+        return (
+            override.get("REQUESTS", self.config["REQUESTS"]),
+            override.get("QUOTAS", self.config["QUOTAS"])
+        )
+
+    def check(self, tenant_id, units=1, now=None):
+        """
+        Charge `units` against the tenant's bucket after verifying its quotas.
+        Returns the decision that applied (the failing one, or the bucket state).
+        """
+        now = time.time() if now is None else now
+        requests_limit, quotas = self._limits(tenant_id)
+
+        for quota in quotas:
+            decision = self._check_quota(tenant_id, quota, now)
+            if not decision.allowed:
+                return decision
+
+        rate = requests_limit["RATE_PER_SECOND"]
+        burst = requests_limit["BURST"]
+        # A single request larger than the burst would never fit; charge it a full bucket instead
+        units = min(units, burst)
+        allowed, tokens_left = self.store.take(f"bucket:{tenant_id}", rate, burst, units, now)
+        if allowed:
+            reset_after_s = (burst - tokens_left) / rate if rate else 0
+        else:
+            reset_after_s = (units - tokens_left) / rate if rate else 60.0
+        return RateLimitDecision(allowed, "requests", burst, tokens_left, reset_after_s)
+
+    def record(self, tenant_id, tokens, cost_usd, now=None):
+        """Add usage from a completed upstream call to every rolling quota"""
+        now = time.time() if now is None else now
+        _, quotas = self._limits(tenant_id)
+        for quota in quotas:
+            amount = tokens if quota["metric"] == "tokens" else cost_usd
+            if amount:
+                slot_s = _slot_seconds(quota)
+                self.store.add_usage(_quota_key(tenant_id, quota), int(now // slot_s), amount)
+
+    def usage(self, tenant_id, now=None):
+        now = time.time() if now is None else now
+        _, quotas = self._limits(tenant_id)
+        report = []
+        for quota in quotas:
+            _, used = self._quota_usage(tenant_id, quota, now)
+            decision = self._check_quota(tenant_id, quota, now)
+            report.append({
+                "metric": quota["metric"],
+                "window_s": quota["window_s"],
+                "limit": quota["limit"],
+                "used": round(used, 6),
+                "reset_after_s": round(decision.reset_after_s, 1)
+            })
+        return report
+
+    def _quota_usage(self, tenant_id, quota, now):
+        first_slot = int(now // _slot_seconds(quota)) - QUOTA_SLOTS_PER_WINDOW + 1
+        slots = self.store.usage_since(_quota_key(tenant_id, quota), first_slot)
+        return slots, sum(amount for _, amount in slots)
+
+    def _check_quota(self, tenant_id, quota, now):
+        slot_s = _slot_seconds(quota)
+        slots, used = self._quota_usage(tenant_id, quota, now)
+        limit = quota["limit"]
+        if used < limit:
+            return RateLimitDecision(True, quota["metric"], limit, limit - used, 0.0)
+
+        # Usage drops as the oldest slots leave the window; find when it dips under the limit
+        reset_after_s = quota["window_s"]
+        for slot, amount in slots:
+            used -= amount
+            if used < limit:
+                reset_after_s = (slot + QUOTA_SLOTS_PER_WINDOW) * slot_s - now
+                break
+        return RateLimitDecision(False, quota["metric"], limit, 0, max(0.0, reset_after_s))
+
+
+def _slot_seconds(quota):
+    return max(1, quota["window_s"] // QUOTA_SLOTS_PER_WINDOW)
+
+
+def _quota_key(tenant_id, quota):
+    return f"quota:{tenant_id}:{quota['metric']}:{quota['window_s']}"
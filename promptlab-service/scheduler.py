@@ -0,0 +1,225 @@
+"""
+Priority scheduler in front of the upstream LLM call layer.
+
+Requests are grouped into priority classes (interactive, optimization, batch).
+Each class owns a number of reserved concurrency slots; the remaining slots are
+shared and handed out by weighted fair queuing, so a burst of low-priority
+work can never take the slots interactive traffic relies on.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_OPTIMIZATION = "optimization"
+PRIORITY_BATCH = "batch"
+
+# Queue-wait samples kept per class for percentile metrics
+WAIT_SAMPLE_SIZE = 1024
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request cannot get an upstream slot (queue full or wait timed out)"""
+
+    def __init__(self, message, priority, retry_after_s=1):
+        super().__init__(message)
+        self.priority = priority
+        self.retry_after_s = retry_after_s
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted sample list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class _Ticket:
+    __slots__ = ("granted", "enqueued_at", "finish_tag")
+
+    def __init__(self):
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+        self.finish_tag = 0.0
+
+
+class _PriorityClass:
+    def __init__(self, name, weight, reserved, max_queue, queue_timeout_s):
+        self.name = name
+        self.weight = weight
+        self.reserved = reserved
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self.in_flight = 0
+        self.waiting = deque()
+        self.finish_tag = 0.0
+        self.acquired = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.wait_samples = deque(maxlen=WAIT_SAMPLE_SIZE)
+
+
+class PriorityScheduler:
+    """
+    Weighted fair queuing over a fixed pool of upstream concurrency slots.
+
+    classes maps a class name to {"weight", "reserved", "max_queue", "queue_timeout_s"}.
+    The sum of reservations must not exceed max_concurrency; whatever is left
+    over forms the shared pool.
+    """
+
+    def __init__(self, max_concurrency, classes):
+        reserved_total = sum(spec["reserved"] for spec in classes.values())
+        if reserved_total > max_concurrency:
+            raise ValueError(
+                f"Reserved slots ({reserved_total}) exceed max concurrency ({max_concurrency})"
+            )
+        self.max_concurrency = max_concurrency
+        self.shared_capacity = max_concurrency - reserved_total
+        self._classes = {
+            name: _PriorityClass(
+                name,
+                spec["weight"],
+                spec["reserved"],
+                spec["max_queue"],
+                spec["queue_timeout_s"]
+            )
+            for name, spec in classes.items()
+        }
+        self._virtual_time = 0.0
+        self._cond = threading.Condition(threading.Lock())
+
+    @contextmanager
+    def slot(self, priority):
+        """Hold one upstream slot for the duration of the with-block"""
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def acquire(self, priority):
+        """Block until a slot is granted; returns the queue wait in seconds"""
+        cls = self._get_class(priority)
+        ticket = _Ticket()
+        deadline = ticket.enqueued_at + cls.queue_timeout_s
+
+        with self._cond:
+            if len(cls.waiting) >= cls.max_queue:
+                cls.rejected += 1
+                raise SchedulerBusy(f"Upstream queue for '{priority}' requests is full", priority)
+
+            # The finish tag is fixed at arrival: a class's tickets are spaced 1/weight apart
+            # in virtual time, so backlogged classes interleave in proportion to their weights
+            ticket.finish_tag = max(self._virtual_time, cls.finish_tag) + 1.0 / cls.weight
+            cls.finish_tag = ticket.finish_tag
+            cls.waiting.append(ticket)
+            self._dispatch()
+
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    cls.waiting.remove(ticket)
+                    cls.timeouts += 1
+                    raise SchedulerBusy(
+                        f"Timed out after {cls.queue_timeout_s}s waiting for an upstream slot",
+                        priority,
+                        retry_after_s=max(1, round(cls.queue_timeout_s / 4))
+                    )
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - ticket.enqueued_at
+            cls.acquired += 1
+            cls.total_wait_s += waited
+            cls.max_wait_s = max(cls.max_wait_s, waited)
+            cls.wait_samples.append(waited)
+
+        if waited > 1:
+            logger.info(f"Scheduler: {priority} request waited {round(waited * 1000)}ms for an upstream slot")
+        return waited
+
+    def release(self, priority):
+        cls = self._get_class(priority)
+        with self._cond:
+            cls.in_flight -= 1
+            self._dispatch()
+
+    def _get_class(self, priority):
+        cls = self._classes.get(priority)
+        if cls is None:
+            raise ValueError(f"Unknown priority class '{priority}'")
+        return cls
+
+    def _shared_in_use(self):
+        return sum(max(0, cls.in_flight - cls.reserved) for cls in self._classes.values())
+
+    def _dispatch(self):
+        """Grant free slots to the eligible head ticket with the smallest finish tag. Caller holds the lock."""
+        granted_any = False
+        while True:
+            shared_free = self._shared_in_use() < self.shared_capacity
+            best_cls = None
+            for cls in self._classes.values():
+                if not cls.waiting:
+                    continue
+                if cls.in_flight >= cls.reserved and not shared_free:
+                    continue
+                if best_cls is None or cls.waiting[0].finish_tag < best_cls.waiting[0].finish_tag:
+                    best_cls = cls
+            if best_cls is None:
+                break
+
+            ticket = best_cls.waiting.popleft()
+            ticket.granted = True
+            best_cls.in_flight += 1
+            # Virtual time follows the start tag of the work being served
+            self._virtual_time = max(self._virtual_time, ticket.finish_tag - 1.0 / best_cls.weight)
+            granted_any = True
+
+        if granted_any:
+            self._cond.notify_all()
+
+    def queue_depth(self):
+        with self._cond:
+            return sum(len(cls.waiting) for cls in self._classes.values())
+
+    def in_flight(self):
+        with self._cond:
+            return sum(cls.in_flight for cls in self._classes.values())
+
+    def metrics(self):
+        with self._cond:
+            classes = {}
+            for cls in self._classes.values():
+                samples = list(cls.wait_samples)
+                classes[cls.name] = {
+                    "weight": cls.weight,
+                    "reserved": cls.reserved,
+                    "in_flight": cls.in_flight,
+                    "queued": len(cls.waiting),
+                    "acquired": cls.acquired,
+                    "rejected": cls.rejected,
+                    "timeouts": cls.timeouts,
+                    "queue_wait_ms": {
+                        "avg": round(cls.total_wait_s / cls.acquired * 1000, 2) if cls.acquired else 0.0,
+                        "p50": round(percentile(samples, 50) * 1000, 2),
+                        "p95": round(percentile(samples, 95) * 1000, 2),
+                        "p99": round(percentile(samples, 99) * 1000, 2),
+                        "max": round(cls.max_wait_s * 1000, 2)
+                    }
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "shared_capacity": self.shared_capacity,
+                "shared_in_use": self._shared_in_use(),
+                "classes": classes
+            }
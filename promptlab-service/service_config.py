@@ -0,0 +1,306 @@
+"""
+Hot-reloadable service configuration.
+
+MODEL_REGISTRY, OPTIMIZATION_CONFIG and PROMPT_TEMPLATES are loaded from a
+JSON file (service_config.json by default, PROMPTLAB_CONFIG to override).
+A background watcher re-reads the file when it changes. A new version is
+validated and its templates are compiled before it replaces the current
+snapshot in a single assignment. Requests that are already running keep
+the snapshot they started with.
+
+Prompt templates may be written either as one string or as a list of lines.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import string
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Placeholders each template may use; anything else would fail at format time
+TEMPLATE_FIELDS = {
+    "QUALITY_INSTRUCTION": set(),
+    "CANDIDATE_GENERATION": {"original_prompt", "optimization_instructions", "token_limit"},
+    "EVALUATION": {
+        "base_prompt", "base_prompt_response", "candidate_prompt",
+        "candidate_prompt_response", "optimization_instructions"
+    },
+    "CANDIDATE_SCORING": {
+        "candidate_prompt", "candidate_prompt_response", "optimization_instructions",
+        "min_score", "max_score"
+    },
+    "REFINEMENT": {"current_prompt", "optimization_instructions"},
+    "FINAL_EVALUATION": {"base_prompt", "final_prompt", "optimization_instructions"}
+}
+
+OPTIMIZATION_STAGES = ("CANDIDATE_GENERATION", "EVALUATION", "REFINEMENT", "FINAL_EVALUATION")
+MODEL_PARAMETERS = ("temperature", "top_p", "max_tokens", "frequency_penalty")
+
+
+class ConfigError(Exception):
+    """Raised when a configuration file cannot be loaded or fails validation"""
+
+
+class CompiledTemplate:
+    """
+    A prompt template parsed once at load time. format() joins the pre-split
+    literal segments with the supplied values instead of re-parsing the
+    template string on every call.
+    """
+
+    __slots__ = ("name", "text", "fields", "_segments")
+
+    _formatter = string.Formatter()
+
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        try:
+            self._segments = list(self._formatter.parse(text))
+        except ValueError as e:
+            raise ConfigError(f"Template '{name}' is malformed: {str(e)}")
+        self.fields = {field for _, field, _, _ in self._segments if field is not None}
+        for field in self.fields:
+            if not field.isidentifier():
+                raise ConfigError(f"Template '{name}' uses unsupported placeholder '{{{field}}}'")
+
+    def format(self, **values):
+        parts = []
+        for literal, field, format_spec, conversion in self._segments:
+            parts.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion:
+                value = self._formatter.convert_field(value, conversion)
+            parts.append(format(value, format_spec) if format_spec else str(value))
+        return "".join(parts)
+
+    def __str__(self):
+        return self.text
+
+
+class ServiceConfig:
+    """One validated, immutable-by-convention configuration snapshot"""
+
+    def __init__(self, models, optimization, templates, version, source, loaded_at):
+        self.models = models
+        self.optimization = optimization
+        self.templates = templates
+        self.version = version
+        self.source = source
+        self.loaded_at = loaded_at
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "models": list(self.models),
+            "templates": sorted(self.templates)
+        }
+
+
+def _require(condition, message):
+    if not condition:
+        raise ConfigError(message)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def _validate_models(models, providers):
+    _require(isinstance(models, dict) and models, "'model_registry' must be a non-empty object")
+    for model_id, model in models.items():
+        where = f"model '{model_id}'"
+        _require(isinstance(model, dict), f"{where} must be an object")
+        for key in ("name", "endpoint", "provider"):
+            _require(isinstance(model.get(key), str) and model[key], f"{where} needs a '{key}' string")
+        _require(model["provider"] in providers, f"{where} uses unknown provider '{model['provider']}'")
+        params = model.get("default_parameters")
+        _require(isinstance(params, dict), f"{where} needs 'default_parameters'")
+        for key in MODEL_PARAMETERS:
+            _require(_is_number(params.get(key)), f"{where} default_parameters.{key} must be a number")
+        cost = model.get("cost")
+        _require(isinstance(cost, dict), f"{where} needs 'cost'")
+        for key in ("input_per_1k", "output_per_1k"):
+            _require(_is_number(cost.get(key)) and cost[key] >= 0, f"{where} cost.{key} must be a non-negative number")
+        if "timeout_s" in model:
+            _require(_is_number(model["timeout_s"]) and model["timeout_s"] > 0, f"{where} timeout_s must be positive")
+        if "routing_group" in model:
+            _require(isinstance(model["routing_group"], str), f"{where} routing_group must be a string")
+
+
+def _validate_optimization(optimization, models):
+    _require(isinstance(optimization, dict), "'optimization' must be an object")
+    for key in ("DEFAULT_ITERATIONS", "DEFAULT_CANDIDATES_PER_ROUND", "DEFAULT_MAX_TOKENS", "MAX_UPSTREAM_CALLS"):
+        _require(_is_positive_int(optimization.get(key)), f"optimization.{key} must be a positive integer")
+    _require(isinstance(optimization.get("DEFAULT_STRATEGY"), str), "optimization.DEFAULT_STRATEGY must be a string")
+    _require(isinstance(optimization.get("STRATEGY_DEFAULTS"), dict), "optimization.STRATEGY_DEFAULTS must be an object")
+
+    stage_models = optimization.get("STAGE_MODELS", {})
+    _require(isinstance(stage_models, dict), "optimization.STAGE_MODELS must be an object")
+    for stage, model_id in stage_models.items():
+        _require(stage in OPTIMIZATION_STAGES, f"optimization.STAGE_MODELS has unknown stage '{stage}'")
+        _require(isinstance(model_id, str), f"optimization.STAGE_MODELS.{stage} must be a model id string")
+        _require(model_id in models, f"optimization.STAGE_MODELS.{stage} references unknown model '{model_id}'")
+
+    for section, stages, check, label in (
+        ("TOKEN_LIMITS", OPTIMIZATION_STAGES, _is_positive_int, "a positive integer"),
+        ("TEMPERATURE_SETTINGS", ("GENERATION",) + OPTIMIZATION_STAGES[1:], _is_number, "a number")
+    ):
+        values = optimization.get(section)
+        _require(isinstance(values, dict), f"optimization.{section} must be an object")
+        for stage in stages:
+            _require(check(values.get(stage)), f"optimization.{section}.{stage} must be {label}")
+
+    compression = optimization.get("COMPRESSION", {})
+    _require(isinstance(compression, dict), "optimization.COMPRESSION must be an object")
+    for key in ("ENABLED", "COLLAPSE_WHITESPACE", "DEDUPE_LINES"):
+        _require(isinstance(compression.get(key, False), bool), f"optimization.COMPRESSION.{key} must be a boolean")
+    if compression.get("RESPONSE_TOKEN_BUDGET") is not None:
+        _require(_is_positive_int(compression["RESPONSE_TOKEN_BUDGET"]),
+                 "optimization.COMPRESSION.RESPONSE_TOKEN_BUDGET must be a positive integer")
+    head_ratio = compression.get("HEAD_RATIO", 0.6)
+    _require(_is_number(head_ratio) and 0 < head_ratio < 1, "optimization.COMPRESSION.HEAD_RATIO must be between 0 and 1")
+
+    ranges = optimization.get("SCORE_RANGES")
+    _require(isinstance(ranges, dict), "optimization.SCORE_RANGES must be an object")
+    for low, high in (("ITERATION_MIN", "ITERATION_MAX"), ("FINAL_MIN", "FINAL_MAX")):
+        _require(_is_number(ranges.get(low)) and _is_number(ranges.get(high)) and ranges[low] < ranges[high],
+                 f"optimization.SCORE_RANGES.{low} must be below {high}")
+
+
+def _compile_templates(raw_templates):
+    _require(isinstance(raw_templates, dict), "'prompt_templates' must be an object")
+    templates = {}
+    for name, allowed in TEMPLATE_FIELDS.items():
+        raw = raw_templates.get(name)
+        if isinstance(raw, list) and all(isinstance(line, str) for line in raw):
+            raw = "\n".join(raw)
+        _require(isinstance(raw, str), f"Template '{name}' is missing or not a string / list of lines")
+        template = CompiledTemplate(name, raw)
+        unknown = template.fields - allowed
+        _require(not unknown, f"Template '{name}' uses unknown placeholders: {', '.join(sorted(unknown))}")
+        templates[name] = template
+    return templates
+
+
+def load_config(path, providers, validators=()):
+    """Read, validate and compile a configuration file into a ServiceConfig"""
+    try:
+        with open(path, "rb") as f:
+            raw_bytes = f.read()
+        document = json.loads(raw_bytes)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"Cannot read config file {path}: {str(e)}")
+
+    _require(isinstance(document, dict), "Config file must contain a JSON object")
+    models = document.get("model_registry")
+    optimization = document.get("optimization")
+    _validate_models(models, providers)
+    _validate_optimization(optimization, models)
+    templates = _compile_templates(document.get("prompt_templates"))
+
+    digest = hashlib.sha256(raw_bytes).hexdigest()[:8]
+    config = ServiceConfig(
+        models,
+        optimization,
+        templates,
+        f"{document.get('version', '0')}+{digest}",
+        os.path.abspath(path),
+        time.time()
+    )
+    for validator in validators:
+        try:
+            validator(config)
+        except ConfigError:
+            raise
+        except Exception as e:
+            raise ConfigError(str(e))
+    return config
+
+
+class ConfigStore:
+    """Holds the current ServiceConfig and swaps it when the file changes"""
+
+    def __init__(self, path, providers, validators=()):
+        self.path = path
+        self.providers = providers
+        self.validators = list(validators)
+        self.last_error = None
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self._fingerprint = self._stat()
+        self._current = load_config(path, providers, self.validators)
+        self._watcher = None
+        logger.info(f"Loaded config version {self._current.version} from {self._current.source}")
+
+    def current(self):
+        return self._current
+
+    def on_reload(self, listener):
+        """Register listener(new_config), called after every successful swap"""
+        self._listeners.append(listener)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+
+    def reload(self):
+        """Load the file again; on failure the current snapshot stays in place"""
+        with self._reload_lock:
+            fingerprint = self._stat()
+            try:
+                config = load_config(self.path, self.providers, self.validators)
+            except Exception as e:
+                # A file the validators did not anticipate can fail with any error type
+                self.last_error = str(e) if isinstance(e, ConfigError) else f"{type(e).__name__}: {str(e)}"
+                self._fingerprint = fingerprint
+                logger.error(f"Config reload failed, keeping version {self._current.version}: {self.last_error}")
+                return False
+
+            self._fingerprint = fingerprint
+            self.last_error = None
+            if config.version == self._current.version:
+                return False
+            previous = self._current
+            self._current = config
+            logger.info(f"Config reloaded: {previous.version} -> {config.version}")
+
+        for listener in self._listeners:
+            try:
+                listener(config)
+            except Exception as e:
+                logger.error(f"Config reload listener failed: {str(e)}")
+        return True
+
+    def start_watcher(self, interval_s=2.0):
+        """Poll the file for changes from a daemon thread"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval_s)
+                if self._stat() != self._fingerprint:
+                    try:
+                        self.reload()
+                    except Exception as e:
+                        logger.error(f"Config watcher error: {str(e)}")
+
+        self._watcher = threading.Thread(target=watch, name="config-watcher", daemon=True)
+        self._watcher.start()
+
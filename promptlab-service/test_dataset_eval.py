@@ -0,0 +1,122 @@
+import json
+import threading
+
+import pytest
+
+from dataset_eval import DatasetEvaluation, EvaluationError, compact_output, load_checkpoint, read_rows
+from service_config import CompiledTemplate
+
+TEMPLATE = CompiledTemplate("dataset", "Translate {text}")
+
+
+class FakeClient:
+    """Answers /generate locally; prompts containing a word in `fail` raise EvaluationError"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, model, parameters):
+        with self._lock:
+            self.prompts.append(prompt)
+        if any(word in prompt for word in self.fail):
+            raise EvaluationError("upstream refused")
+        return {
+            "output": prompt.upper(),
+            "served_by": model,
+            "metrics": {"tokens_input": 2, "tokens_output": 3, "cost_usd": 0.5}
+        }
+
+
+def rows(*texts):
+    return [(index, {"text": text}) for index, text in enumerate(texts)]
+
+
+def evaluate(client, output_path, dataset, concurrency=2):
+    evaluation = DatasetEvaluation(client, TEMPLATE, "flash", {}, str(output_path), concurrency, progress_every=0)
+    return evaluation.run(iter(dataset))
+
+
+def read_output(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_identical_prompts_are_sent_once(tmp_path):
+    client = FakeClient()
+    summary = evaluate(client, tmp_path / "out.jsonl", rows("a", "b", "a", "a", "b"))
+    assert sorted(client.prompts) == ["Translate a", "Translate b"]
+    assert (summary["rows"], summary["succeeded"], summary["cached"]) == (5, 5, 3)
+    # Reused results cost nothing
+    assert summary["cost_usd"] == 1.0
+    records = read_output(tmp_path / "out.jsonl")
+    assert [record["index"] for record in records] == [0, 1, 2, 3, 4]
+    assert all(record["output"] == f"TRANSLATE {record['input_variables']['text'].upper()}" for record in records)
+
+
+def test_bad_rows_are_recorded_as_failures(tmp_path):
+    dataset = [(0, {"text": "a"}), (1, {"other": "x"}), (2, ["not", "an", "object"]), (3, EvaluationError("Invalid JSON"))]
+    summary = evaluate(FakeClient(), tmp_path / "out.jsonl", dataset)
+    assert (summary["succeeded"], summary["failed"]) == (1, 3)
+    errors = {record["index"]: record["error_message"] for record in read_output(tmp_path / "out.jsonl")}
+    assert "missing template field" in errors[1]
+    assert errors[2] == "Row must be a JSON object"
+    assert errors[3] == "Invalid JSON"
+
+
+def test_resume_retries_failures_and_folds_earlier_results_into_the_summary(tmp_path):
+    output = tmp_path / "out.jsonl"
+    dataset = rows("a", "b", "c", "d", "a")
+
+    first = evaluate(FakeClient(fail=["c"]), output, dataset)
+    assert (first["succeeded"], first["failed"], first["cost_usd"]) == (4, 1, 1.5)
+
+    client = FakeClient()
+    second = evaluate(client, output, dataset)
+    # Only the failed row goes upstream again
+    assert client.prompts == ["Translate c"]
+    assert second["skipped_from_checkpoint"] == 4
+    assert (second["rows"], second["succeeded"], second["failed"], second["cached"]) == (5, 5, 0, 1)
+    assert second["cost_usd"] == 2.0
+    assert (second["tokens_input"], second["tokens_output"]) == (8, 12)
+    assert second["elapsed_s"] >= second["run_elapsed_s"]
+
+    # One line per row, the latest attempt, in row order
+    records = read_output(output)
+    assert [record["index"] for record in records] == [0, 1, 2, 3, 4]
+    assert all(record["success"] for record in records)
+
+    third = evaluate(FakeClient(), output, dataset)
+    assert third["skipped_from_checkpoint"] == 5 and third["cost_usd"] == 2.0
+    assert len(read_output(output)) == 5
+
+
+def test_checkpoint_keeps_the_latest_attempt_and_skips_torn_lines(tmp_path):
+    output = tmp_path / "out.jsonl"
+    lines = [
+        {"index": 1, "success": False, "prompt_sha256": "k1", "run_started_at": 100.0, "finished_at": 101.0},
+        {"index": 0, "success": True, "prompt_sha256": "k0", "run_started_at": 100.0, "finished_at": 104.0},
+        {"index": 1, "success": True, "prompt_sha256": "k1", "run_started_at": 200.0, "finished_at": 202.5},
+    ]
+    with open(output, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+        f.write('{"index": 2, "succ')
+
+    latest, previous_elapsed_s = load_checkpoint(str(output))
+    assert sorted(latest) == [0, 1]
+    assert latest[1]["success"] is True
+    assert previous_elapsed_s == pytest.approx(4.0 + 2.5)
+
+    compact_output(str(output))
+    assert [(record["index"], record["success"]) for record in read_output(output)] == [(0, True), (1, True)]
+
+
+def test_read_rows_skips_blank_lines(tmp_path):
+    path = tmp_path / "in.jsonl"
+    path.write_text('{"text": "a"}\n\n{broken\n{"text": "b"}\n')
+    parsed = list(read_rows(str(path)))
+    assert [index for index, _ in parsed] == [0, 1, 2]
+    assert isinstance(parsed[1][1], EvaluationError)
+    assert parsed[2][1] == {"text": "b"}
@@ -46,6 +46,42 @@ def test_models_endpoint():
         print(f"❌ Models endpoint error: {e}")
         return False
 
+def test_scheduler_metrics():
+    """Test the upstream scheduler metrics endpoint"""
+    print("Testing scheduler metrics...")
+    try:
+        response = requests.get(f"{BASE_URL}/metrics/scheduler")
+        if response.status_code == 200:
+            classes = response.json().get('classes', {})
+            if all(name in classes for name in ['interactive', 'optimization', 'batch']):
+                print("✅ Scheduler metrics working")
+                print(f"   Queued per class: {dict((name, c['queued']) for name, c in classes.items())}")
+                return True
+            print("❌ Scheduler metrics missing priority classes")
+            return False
+        else:
+            print(f"❌ Scheduler metrics failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Scheduler metrics error: {e}")
+        return False
+
+def test_liveness():
+    """Test the liveness probe"""
+    print("Testing liveness probe...")
+    try:
+        response = requests.get(f"{BASE_URL}/health/live")
+        if response.status_code == 200:
+            print("✅ Liveness probe working")
+            print(f"   Uptime: {response.json().get('uptime_s')}s")
+            return True
+        else:
+            print(f"❌ Liveness probe failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Liveness probe error: {e}")
+        return False
+
 def test_generate_endpoint():
     """Test the generate endpoint (will fail without API key, but should validate input)"""
     print("Testing generate endpoint...")
@@ -109,6 +145,8 @@ def main():
     tests = [
         test_health_check,
         test_models_endpoint,
+        test_scheduler_metrics,
+        test_liveness,
         test_generate_endpoint,
         test_chat_endpoint
     ]
@@ -0,0 +1,85 @@
+import itertools
+import os
+
+import pytest
+
+from model_router import ROUTING_STRICT
+from optimization_strategies import OptimizationContext, STAGE_RESPONSE, build_strategy
+from service_config import load_config
+
+CONFIG = load_config(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "service_config.json"),
+    {"Google": None, "OpenAI": None}
+)
+
+
+class StubLLM:
+    """Stands in for call_llm: records every call and answers by stage"""
+
+    def __init__(self):
+        self.calls = []
+        self._counter = itertools.count(1)
+
+    def __call__(self, prompt_text, temp, tokens, stage_name, model_id=None, stage=None, routing=None):
+        n = next(self._counter)
+        self.calls.append({"prompt": prompt_text, "tokens": tokens, "stage": stage, "routing": routing,
+                           "stage_name": stage_name})
+        if stage == "EVALUATION" and "WINNER" in prompt_text:
+            return "WINNER: B" if n % 2 else "WINNER: A"
+        if stage in ("EVALUATION", "FINAL_EVALUATION"):
+            return f"SCORE: {n % 40}\nREASONING: stub"
+        return f"output {n}"
+
+
+def run_strategy(name, params):
+    strategy = build_strategy(name, params, CONFIG.optimization)
+    llm = StubLLM()
+    ctx = OptimizationContext(
+        "test", "Write a haiku about rain", "Make it vivid", 0.7, 256, llm,
+        CONFIG.templates, CONFIG.optimization, "gemini-1.5-flash"
+    )
+    result = strategy.run(ctx)
+    return strategy, ctx, llm, result
+
+
+@pytest.mark.parametrize("name, params", [
+    ("greedy", {}),
+    ("greedy", {"iterations": 2, "candidates_per_round": 3, "refinement_rounds": 1, "final_evaluation": True}),
+    ("beam", {}),
+    ("beam", {"iterations": 3, "beam_width": 2, "candidates_per_beam": 2}),
+    ("successive_halving", {}),
+    ("successive_halving", {"initial_candidates": 5, "eta": 2, "refinement_rounds": 2, "final_evaluation": True}),
+    ("successive_halving", {"initial_candidates": 1}),
+])
+def test_expected_calls_match_upstream_calls(name, params):
+    strategy, ctx, llm, result = run_strategy(name, params)
+    assert ctx.upstream_calls == len(llm.calls) == strategy.expected_calls()
+    assert strategy.describe()["expected_upstream_calls"] == strategy.expected_calls()
+    assert result["best"]["prompt"] and result["best"]["response"]
+
+
+def test_greedy_generates_a_round_from_the_round_start_best():
+    _, _, llm, _ = run_strategy("greedy", {"iterations": 2, "candidates_per_round": 3})
+    generations = [call for call in llm.calls if call["stage"] == "CANDIDATE_GENERATION"]
+    first_round, second_round = generations[:3], generations[3:]
+    assert all("Write a haiku about rain" in call["prompt"] for call in first_round)
+    # All of the second round's candidates share one parent prompt
+    assert len({call["prompt"] for call in second_round}) == 1
+
+
+def test_successive_halving_does_not_score_the_last_survivor():
+    _, _, llm, _ = run_strategy("successive_halving", {"initial_candidates": 4, "eta": 2})
+    stage_names = [call["stage_name"] for call in llm.calls]
+    assert not any(stage_name.startswith("candidate_scoring_rung3") for stage_name in stage_names)
+    assert "candidate_response_rung3_cand1" in stage_names
+
+
+def test_responses_are_pinned_to_the_requested_model():
+    _, _, llm, _ = run_strategy("greedy", {"iterations": 1, "candidates_per_round": 2})
+    responses = [call for call in llm.calls if call["stage"] == STAGE_RESPONSE]
+    assert responses and all(call["routing"] == ROUTING_STRICT for call in responses)
+
+
+def test_over_budget_plans_are_rejected():
+    with pytest.raises(ValueError, match="upstream calls"):
+        build_strategy("greedy", {"iterations": 50, "candidates_per_round": 50}, CONFIG.optimization)
@@ -0,0 +1,95 @@
+import pytest
+
+from rate_limit import MemoryStore, SqliteStore, TenantLimiter, create_store
+
+T0 = 1_000_000.0
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore()
+    return SqliteStore(str(tmp_path / "limits.db"))
+
+
+def make_limiter(store, quotas=(), overrides=None, rate=1.0, burst=5):
+    return TenantLimiter({
+        "REQUESTS": {"RATE_PER_SECOND": rate, "BURST": burst},
+        "QUOTAS": list(quotas),
+        "TENANT_OVERRIDES": overrides or {}
+    }, store)
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate(store):
+    limiter = make_limiter(store)
+    for _ in range(5):
+        assert limiter.check("org:a", now=T0).allowed
+    decision = limiter.check("org:a", now=T0)
+    assert not decision.allowed
+    assert decision.limit_type == "requests"
+    assert decision.reset_after_s == pytest.approx(1.0)
+    assert decision.retry_after_s == 1
+    assert limiter.check("org:a", now=T0 + 1.0).allowed
+    # Tenants have separate buckets
+    assert limiter.check("org:b", now=T0).allowed
+
+
+def test_bucket_charges_units_and_caps_oversized_requests_at_the_burst(store):
+    limiter = make_limiter(store, rate=2.0, burst=10)
+    decision = limiter.check("org:a", units=4, now=T0)
+    assert decision.allowed and decision.remaining == pytest.approx(6)
+    assert decision.reset_after_s == pytest.approx(2.0)
+    # 40 units never fit in a bucket of 10; the request is charged a full bucket instead
+    assert not limiter.check("org:a", units=40, now=T0).allowed
+    assert limiter.check("org:a", units=40, now=T0 + 2.0).allowed
+    assert not limiter.check("org:a", now=T0 + 2.0).allowed
+
+
+def test_quota_denies_until_the_oldest_usage_leaves_the_window(store):
+    limiter = make_limiter(store, quotas=[{"metric": "tokens", "window_s": 60, "limit": 100}], burst=100)
+    limiter.record("org:a", 60, 0.0, now=T0)
+    limiter.record("org:a", 50, 0.0, now=T0 + 10)
+    decision = limiter.check("org:a", now=T0 + 11)
+    assert not decision.allowed
+    assert decision.limit_type == "tokens"
+    # Dropping the T0 slot brings usage under the limit; that slot leaves the window at T0 + 60
+    assert decision.reset_after_s == pytest.approx(49)
+    assert limiter.check("org:a", now=T0 + 60).allowed
+    assert limiter.usage("org:a", now=T0 + 60)[0]["used"] == pytest.approx(50)
+
+
+def test_quota_denial_does_not_spend_the_bucket(store):
+    limiter = make_limiter(store, quotas=[{"metric": "cost_usd", "window_s": 3600, "limit": 1.0}], burst=2)
+    limiter.record("org:a", 0, 1.5, now=T0)
+    for _ in range(3):
+        assert limiter.check("org:a", now=T0).limit_type == "cost_usd"
+    limiter_without_quota = make_limiter(store, burst=2)
+    assert limiter_without_quota.check("org:a", units=2, now=T0).allowed
+
+
+def test_anonymous_tenants_skip_quotas(store):
+    limiter = make_limiter(store, quotas=[{"metric": "tokens", "window_s": 60, "limit": 10}])
+    limiter.record("ip:10.0.0.1", 1000, 0.0, now=T0)
+    assert limiter.check("ip:10.0.0.1", now=T0).allowed
+    assert limiter.usage("ip:10.0.0.1", now=T0) == []
+
+
+def test_tenant_overrides_replace_the_defaults(store):
+    limiter = make_limiter(store, quotas=[{"metric": "tokens", "window_s": 60, "limit": 10}], overrides={
+        "org:big": {"REQUESTS": {"RATE_PER_SECOND": 1.0, "BURST": 50}, "QUOTAS": []}
+    })
+    limiter.record("org:big", 1000, 0.0, now=T0)
+    decision = limiter.check("org:big", units=20, now=T0)
+    assert decision.allowed and decision.limit == 50
+
+
+def test_decision_headers():
+    decision = make_limiter(MemoryStore()).check("org:a", units=2, now=T0)
+    assert decision.headers() == {"X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "3", "X-RateLimit-Reset": "2"}
+
+
+def test_create_store(tmp_path):
+    assert isinstance(create_store("memory"), MemoryStore)
+    assert isinstance(create_store(f"sqlite:///{tmp_path}/nested/limits.db"), SqliteStore)
+    with pytest.raises(ValueError):
+        create_store("redis://localhost")
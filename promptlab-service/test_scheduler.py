@@ -0,0 +1,40 @@
+import threading
+import time
+
+from scheduler import PriorityScheduler
+
+
+def test_backlogged_classes_interleave_by_weight():
+    """With one slot and both queues backlogged, grants follow the 3:1 weights instead of draining one class first"""
+    scheduler = PriorityScheduler(1, {
+        "holder": {"weight": 1, "reserved": 0, "max_queue": 1, "queue_timeout_s": 10},
+        "optimization": {"weight": 3, "reserved": 0, "max_queue": 64, "queue_timeout_s": 10},
+        "batch": {"weight": 1, "reserved": 0, "max_queue": 64, "queue_timeout_s": 10}
+    })
+    grants = []
+    grants_lock = threading.Lock()
+
+    def worker(priority):
+        with scheduler.slot(priority):
+            with grants_lock:
+                grants.append(priority[0])
+
+    scheduler.acquire("holder")
+    threads = []
+    for priority in ["optimization"] * 20 + ["batch"] * 20:
+        thread = threading.Thread(target=worker, args=(priority,))
+        thread.start()
+        threads.append(thread)
+    while scheduler.queue_depth() < 40:
+        time.sleep(0.01)
+
+    scheduler.release("holder")
+    for thread in threads:
+        thread.join(timeout=10)
+
+    order = "".join(grants)
+    assert len(order) == 40
+    # Every window of four grants while both classes are backlogged holds three optimization and one batch
+    for start in range(0, 24, 4):
+        window = order[start:start + 4]
+        assert window.count("o") == 3 and window.count("b") == 1, order
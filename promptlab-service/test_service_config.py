@@ -0,0 +1,183 @@
+import json
+import os
+import time
+
+import pytest
+
+from service_config import ConfigError, ConfigStore, load_config
+
+BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "service_config.json")
+PROVIDERS = {"Google": None, "OpenAI": None}
+
+
+def base_document():
+    with open(BASE_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write(path, document):
+    # Replace atomically so the watcher never sees a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(document, f)
+    os.replace(tmp_path, path)
+
+
+def test_shipped_config_loads():
+    config = load_config(BASE_PATH, PROVIDERS)
+    assert "gemini-1.5-flash" in config.models
+    assert config.version.startswith(f"{base_document()['version']}+")
+
+
+def _unknown_provider(doc):
+    doc["model_registry"]["gemini-1.5-flash"]["provider"] = "Acme"
+
+
+def _negative_cost(doc):
+    doc["model_registry"]["gemini-1.5-flash"]["cost"]["input_per_1k"] = -1
+
+
+def _unknown_stage(doc):
+    doc["optimization"]["STAGE_MODELS"] = {"SUMMARY": "gemini-1.5-flash"}
+
+
+def _unknown_stage_model(doc):
+    doc["optimization"]["STAGE_MODELS"] = {"EVALUATION": "gpt-9"}
+
+
+def _non_string_stage_model(doc):
+    doc["optimization"]["STAGE_MODELS"] = {"EVALUATION": ["x"]}
+
+
+def _zero_iterations(doc):
+    doc["optimization"]["DEFAULT_ITERATIONS"] = 0
+
+
+def _inverted_score_range(doc):
+    doc["optimization"]["SCORE_RANGES"]["ITERATION_MIN"] = 100
+
+
+def _bad_head_ratio(doc):
+    doc["optimization"]["COMPRESSION"]["HEAD_RATIO"] = 1.5
+
+
+def _missing_template(doc):
+    del doc["prompt_templates"]["EVALUATION"]
+
+
+def _unknown_placeholder(doc):
+    doc["prompt_templates"]["REFINEMENT"] = "Improve {current_prompt} for {audience}"
+
+
+@pytest.mark.parametrize("mutate, message", [
+    (_unknown_provider, "unknown provider"),
+    (_negative_cost, "non-negative"),
+    (_unknown_stage, "unknown stage"),
+    (_unknown_stage_model, "unknown model"),
+    (_non_string_stage_model, "model id string"),
+    (_zero_iterations, "DEFAULT_ITERATIONS"),
+    (_inverted_score_range, "ITERATION_MIN"),
+    (_bad_head_ratio, "HEAD_RATIO"),
+    (_missing_template, "EVALUATION"),
+    (_unknown_placeholder, "audience"),
+])
+def test_invalid_configs_are_rejected(tmp_path, mutate, message):
+    document = base_document()
+    mutate(document)
+    path = tmp_path / "config.json"
+    write(path, document)
+    with pytest.raises(ConfigError, match=message):
+        load_config(str(path), PROVIDERS)
+
+
+def test_unreadable_file_is_a_config_error(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text("{not json")
+    with pytest.raises(ConfigError):
+        load_config(str(path), PROVIDERS)
+
+
+def test_validator_errors_become_config_errors(tmp_path):
+    def validator(config):
+        raise KeyError("DEFAULT_STRATEGY")
+
+    with pytest.raises(ConfigError):
+        load_config(BASE_PATH, PROVIDERS, [validator])
+
+
+def test_failed_reload_keeps_the_current_snapshot(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, base_document())
+    store = ConfigStore(str(path), PROVIDERS)
+    version = store.current().version
+
+    def explode(config):
+        raise ConfigError("boom")
+
+    store.validators.append(explode)
+    assert store.reload() is False
+    assert store.current().version == version
+    assert store.last_error == "boom"
+
+
+def test_the_watcher_survives_bad_files(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    document = base_document()
+    write(path, document)
+    store = ConfigStore(str(path), PROVIDERS)
+    reloaded = []
+    store.on_reload(reloaded.append)
+
+    def crash(*args, **kwargs):
+        raise TypeError("unhashable type: 'list'")
+
+    store.start_watcher(interval_s=0.02)
+
+    document["version"] = "broken"
+    document["optimization"]["STAGE_MODELS"] = {"EVALUATION": {"model": "gemini-1.5-flash"}}
+    time.sleep(0.05)
+    write(path, document)
+    _wait_for(lambda: store.last_error is not None)
+    assert "model id string" in store.last_error
+    assert store._watcher.is_alive()
+
+    # Errors the validators do not anticipate must not stop the watcher either
+    monkeypatch.setattr("service_config.load_config", crash)
+    document["optimization"]["STAGE_MODELS"] = {}
+    document["version"] = "next"
+    time.sleep(0.05)
+    write(path, document)
+    _wait_for(lambda: store.last_error == "TypeError: unhashable type: 'list'")
+    assert store._watcher.is_alive()
+
+    monkeypatch.undo()
+    document["version"] = "final"
+    time.sleep(0.05)
+    write(path, document)
+    _wait_for(lambda: store.current().version.startswith("final+"))
+    assert store.last_error is None
+    assert [config.version for config in reloaded] == [store.current().version]
+
+
+def test_reload_catches_non_config_errors(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    write(path, base_document())
+    store = ConfigStore(str(path), PROVIDERS)
+    version = store.current().version
+
+    def broken(*args, **kwargs):
+        raise TypeError("unhashable type: 'list'")
+
+    monkeypatch.setattr("service_config.load_config", broken)
+    assert store.reload() is False
+    assert store.current().version == version
+    assert store.last_error == "TypeError: unhashable type: 'list'"
+
+
+def _wait_for(condition, timeout_s=5):
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if condition():
+            return
+        time.sleep(0.02)
+    raise AssertionError("condition not reached")
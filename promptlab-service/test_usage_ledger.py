@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from usage_ledger import (
+    LATENCY_BUCKETS_MS, STATUS_ERROR, UsageLedger, choose_granularity, histogram_percentile, latency_slot
+)
+
+
+def test_latency_slot_boundaries():
+    assert latency_slot(0) == 0
+    assert latency_slot(25) == 0
+    assert latency_slot(25.1) == 1
+    assert latency_slot(120000) == len(LATENCY_BUCKETS_MS) - 1
+    assert latency_slot(500000) == len(LATENCY_BUCKETS_MS)
+
+
+def test_histogram_percentile_interpolates_within_a_bucket():
+    assert histogram_percentile({}, 50, 0) is None
+    # Ten calls at or under 25ms, the slowest 20ms: the bucket is clipped to the observed max
+    assert histogram_percentile({0: 10}, 50, 20) == 10.0
+    # Half in 50-100ms, half in 250-500ms with a 400ms max
+    counts = {latency_slot(80): 50, latency_slot(300): 50}
+    assert histogram_percentile(counts, 50, 400) == 100.0
+    assert histogram_percentile(counts, 95, 400) == 385.0
+    assert histogram_percentile(counts, 100, 400) == 400.0
+
+
+def test_histogram_percentile_bounds_the_overflow_slot_by_the_max():
+    assert histogram_percentile({len(LATENCY_BUCKETS_MS): 4}, 50, 200000) == 160000.0
+
+
+def test_choose_granularity():
+    now = 10_000_000.0
+    assert choose_granularity(now - 3600, now, now, 7 * 86400) == "minute"
+    assert choose_granularity(now - 86400, now, now, 7 * 86400) == "hour"
+    assert choose_granularity(now - 30 * 86400, now, now, 7 * 86400) == "day"
+    # Minute rollups that were pruned cannot answer a short but old range
+    assert choose_granularity(now - 10 * 86400, now - 10 * 86400 + 600, now, 7 * 86400) == "hour"
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return UsageLedger(str(tmp_path / "usage.db"), {
+        "BATCH_SIZE": 100,
+        "FLUSH_INTERVAL_S": 0.01,
+        "MAX_QUEUE": 1000,
+        "MINUTE_RETENTION_DAYS": 7
+    })
+
+
+def test_rollups_agree_at_every_granularity(ledger):
+    hour = int(time.time() // 3600 * 3600) - 3600
+    ledger.record("org:a", "flash", "GENERATE", 10, 20, 0.5, 100, ts=hour + 10)
+    ledger.record("org:a", "flash", "GENERATE", 30, 40, 1.5, 300, ts=hour + 70)
+    ledger.record("org:a", "flash", "GENERATE", 5, 0, 0.0, 900, status=STATUS_ERROR, ts=hour + 80)
+    ledger.record("org:b", "flash-8b", "EVALUATION", 1, 1, 0.25, 50, ts=hour + 20)
+    assert ledger.flush(timeout_s=5)
+
+    for granularity in ("minute", "hour", "day"):
+        report = ledger.query(hour, hour + 3600, granularity=granularity)
+        rows = {(row["tenant"], row["model"]): row for row in report["rows"]}
+        a = rows[("org:a", "flash")]
+        assert (a["calls"], a["errors"]) == (3, 1)
+        assert (a["tokens_input"], a["tokens_output"], a["cost_usd"]) == (45, 60, 2.0)
+        # Failed calls count toward calls and errors but not toward latency
+        assert a["latency_ms"]["avg"] == 200.0
+        assert a["latency_ms"]["max"] == 300.0
+        assert rows[("org:b", "flash-8b")]["cost_usd"] == 0.25
+        # Most expensive first
+        assert report["rows"][0]["tenant"] == "org:a"
+
+    by_minute = ledger.query(hour, hour + 3600, group_by=["bucket"], tenant="org:a", granularity="minute")
+    assert [(row["bucket"], row["calls"]) for row in sorted(by_minute["rows"], key=lambda r: r["bucket"])] == [
+        (hour, 1), (hour + 60, 2)
+    ]
+    assert ledger.stats()["written"] == 4
+
+
+def test_query_rejects_unknown_fields(ledger):
+    with pytest.raises(ValueError):
+        ledger.query(0, group_by=["region"])
+    with pytest.raises(ValueError):
+        ledger.query(0, granularity="week")
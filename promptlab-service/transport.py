@@ -0,0 +1,146 @@
+"""
+HTTP transport helpers: fast JSON (de)serialization and negotiated response
+compression.
+
+orjson and brotli are optional. Without orjson Flask's default JSON provider
+is kept. Without brotli only gzip is offered.
+"""
+
+import gzip
+import logging
+
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "text/plain",
+    "text/html",
+    "text/csv"
+}
+
+
+def _orjson_default(obj):
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for both request parsing and responses"""
+
+    options = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_orjson_default, option=self.options),
+            mimetype="application/json"
+        )
+
+
+def install_json_provider(app):
+    """Switch the app to orjson when it is installed"""
+    if orjson is None:
+        logger.info("orjson not installed, using the default JSON provider")
+        return False
+    app.json = OrjsonProvider(app)
+    return True
+
+
+def _accepted_encodings(header):
+    """Map of encoding -> q-value from an Accept-Encoding header"""
+    accepted = {}
+    for part in header.split(","):
+        pieces = part.strip().split(";")
+        name = pieces[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in pieces[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """Best supported encoding for an Accept-Encoding header, or None"""
+    if not header:
+        return None
+    accepted = _accepted_encodings(header)
+    wildcard = accepted.get("*", 0.0)
+    offers = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for encoding in offers:
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def install_compression(app, config):
+    """
+    Compress responses of at least config["MIN_SIZE_BYTES"] when the client
+    accepts gzip or br.
+
+    config: {"ENABLED", "MIN_SIZE_BYTES", "GZIP_LEVEL", "BROTLI_QUALITY"}
+    """
+    if not config["ENABLED"]:
+        return
+
+    from flask import request
+
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        body = response.get_data()
+        if len(body) < config["MIN_SIZE_BYTES"]:
+            return response
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=config["BROTLI_QUALITY"])
+        else:
+            compressed = gzip.compress(body, compresslevel=config["GZIP_LEVEL"], mtime=0)
+
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        return response
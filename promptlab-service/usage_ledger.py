@@ -0,0 +1,310 @@
+"""
+Append-only usage ledger for upstream calls.
+
+Every upstream attempt (model, stage, tenant, tokens, cost, latency) is queued
+in memory and written by a background thread in batches, so the request path
+never waits on disk. Each batch is appended to usage_events. In the same
+transaction it is folded into per-minute, per-hour and per-day rollups and
+into latency histograms. Queries such as spend and p95 latency per model per
+tenant read only the rollups, never the raw rows.
+
+Latency percentiles come from fixed histogram buckets (LATENCY_BUCKETS_MS),
+interpolated within the bucket that holds the requested rank.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
+GROUP_FIELDS = ("tenant", "model", "stage", "bucket")
+
+# Upper bounds of the latency histogram slots; one extra slot holds everything slower
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 750, 1000, 1500, 2500, 4000, 6000, 10000, 15000, 30000, 60000, 120000)
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS usage_events ("
+    "id INTEGER PRIMARY KEY, ts REAL NOT NULL, tenant TEXT NOT NULL, model TEXT NOT NULL, "
+    "requested_model TEXT, stage TEXT NOT NULL, request_id TEXT, status TEXT NOT NULL, "
+    "tokens_input INTEGER NOT NULL, tokens_output INTEGER NOT NULL, cost_usd REAL NOT NULL, "
+    "latency_ms REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS usage_rollups ("
+    "granularity TEXT NOT NULL, bucket INTEGER NOT NULL, tenant TEXT NOT NULL, model TEXT NOT NULL, "
+    "stage TEXT NOT NULL, calls INTEGER NOT NULL, errors INTEGER NOT NULL, "
+    "tokens_input INTEGER NOT NULL, tokens_output INTEGER NOT NULL, cost_usd REAL NOT NULL, "
+    "latency_ms_sum REAL NOT NULL, latency_ms_max REAL NOT NULL, "
+    "PRIMARY KEY (granularity, bucket, tenant, model, stage))",
+    "CREATE TABLE IF NOT EXISTS usage_latency_hist ("
+    "granularity TEXT NOT NULL, bucket INTEGER NOT NULL, tenant TEXT NOT NULL, model TEXT NOT NULL, "
+    "stage TEXT NOT NULL, slot INTEGER NOT NULL, count INTEGER NOT NULL, "
+    "PRIMARY KEY (granularity, bucket, tenant, model, stage, slot))"
+)
+
+
+def latency_slot(latency_ms):
+    for slot, upper in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= upper:
+            return slot
+    return len(LATENCY_BUCKETS_MS)
+
+
+def histogram_percentile(counts, pct, max_ms):
+    """Estimate a percentile from {slot: count}; the overflow slot is bounded by the observed max"""
+    total = sum(counts.values())
+    if not total:
+        return None
+    rank = pct / 100 * total
+    seen = 0
+    for slot in sorted(counts):
+        count = counts[slot]
+        if seen + count >= rank:
+            lower = LATENCY_BUCKETS_MS[slot - 1] if slot > 0 else 0
+            upper = LATENCY_BUCKETS_MS[slot] if slot < len(LATENCY_BUCKETS_MS) else max_ms
+            upper = min(upper, max_ms)
+            lower = min(lower, upper)
+            return round(lower + (upper - lower) * (rank - seen) / count, 1)
+        seen += count
+    return round(max_ms, 1)
+
+
+def choose_granularity(since, until, now, minute_retention_s):
+    """Finest rollup that keeps the number of buckets scanned small for the range"""
+    span = until - since
+    if span <= 6 * 3600 and since >= now - minute_retention_s:
+        return "minute"
+    if span <= 14 * 86400:
+        return "hour"
+    return "day"
+
+
+class UsageLedger:
+    """
+    config: {
+        "BATCH_SIZE": int,              # most events written per transaction
+        "FLUSH_INTERVAL_S": float,      # longest an event waits in memory
+        "MAX_QUEUE": int,               # events beyond this are dropped rather than blocking callers
+        "MINUTE_RETENTION_DAYS": float  # minute rollups older than this are pruned
+    }
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.minute_retention_s = config["MINUTE_RETENTION_DAYS"] * 86400
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=config["MAX_QUEUE"])
+        self._local = threading.local()
+        self._last_prune = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        self._writer = threading.Thread(target=self._run, name="usage-ledger", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush, timeout_s=5)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, tenant, model, stage, tokens_input, tokens_output, cost_usd, latency_ms,
+               status=STATUS_OK, requested_model=None, request_id=None, ts=None):
+        """Queue one upstream call; never blocks"""
+        event = (
+            ts or time.time(), tenant or "unknown", model, requested_model or model, stage,
+            request_id, status, int(tokens_input), int(tokens_output), float(cost_usd), float(latency_ms)
+        )
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout_s=None):
+        """Wait until everything queued so far has been written"""
+        deadline = None if timeout_s is None else time.time() + timeout_s
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _run(self):
+        batch_size = self.config["BATCH_SIZE"]
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + self.config["FLUSH_INTERVAL_S"]
+            while len(batch) < batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.error(f"Usage ledger write of {len(batch)} events failed: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        rollups = {}
+        histogram = {}
+        for ts, tenant, model, _, stage, _, status, tokens_input, tokens_output, cost_usd, latency_ms in batch:
+            failed = status != STATUS_OK
+            for granularity, size in GRANULARITIES.items():
+                key = (granularity, int(ts // size * size), tenant, model, stage)
+                row = rollups.setdefault(key, [0, 0, 0, 0, 0.0, 0.0, 0.0])
+                row[0] += 1
+                row[1] += failed
+                row[2] += tokens_input
+                row[3] += tokens_output
+                row[4] += cost_usd
+                if not failed:
+                    row[5] += latency_ms
+                    row[6] = max(row[6], latency_ms)
+                    slot_key = key + (latency_slot(latency_ms),)
+                    histogram[slot_key] = histogram.get(slot_key, 0) + 1
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO usage_events (ts, tenant, model, requested_model, stage, request_id, status, "
+                "tokens_input, tokens_output, cost_usd, latency_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            conn.executemany(
+                "INSERT INTO usage_rollups (granularity, bucket, tenant, model, stage, calls, errors, "
+                "tokens_input, tokens_output, cost_usd, latency_ms_sum, latency_ms_max) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(granularity, bucket, tenant, model, stage) DO UPDATE SET "
+                "calls = calls + excluded.calls, errors = errors + excluded.errors, "
+                "tokens_input = tokens_input + excluded.tokens_input, "
+                "tokens_output = tokens_output + excluded.tokens_output, "
+                "cost_usd = cost_usd + excluded.cost_usd, "
+                "latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum, "
+                "latency_ms_max = max(latency_ms_max, excluded.latency_ms_max)",
+                [key + tuple(row) for key, row in rollups.items()]
+            )
+            conn.executemany(
+                "INSERT INTO usage_latency_hist (granularity, bucket, tenant, model, stage, slot, count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(granularity, bucket, tenant, model, stage, slot) DO UPDATE SET "
+                "count = count + excluded.count",
+                [key + (count,) for key, count in histogram.items()]
+            )
+            now = time.time()
+            if now - self._last_prune > 3600:
+                cutoff = now - self.minute_retention_s
+                conn.execute("DELETE FROM usage_rollups WHERE granularity = 'minute' AND bucket < ?", (cutoff,))
+                conn.execute("DELETE FROM usage_latency_hist WHERE granularity = 'minute' AND bucket < ?", (cutoff,))
+                self._last_prune = now
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def query(self, since, until=None, group_by=("tenant", "model"), tenant=None, model=None, granularity=None):
+        """
+        Aggregate the rollups between since and until (unix seconds). The range
+        is widened to whole buckets of the chosen granularity.
+        """
+        now = time.time()
+        until = until or now
+        granularity = granularity or choose_granularity(since, until, now, self.minute_retention_s)
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularity '{granularity}' not supported. Available: {', '.join(GRANULARITIES)}")
+        unknown = [field for field in group_by if field not in GROUP_FIELDS]
+        if unknown:
+            raise ValueError(f"Cannot group by {', '.join(unknown)}. Available: {', '.join(GROUP_FIELDS)}")
+
+        size = GRANULARITIES[granularity]
+        first_bucket = int(since // size * size)
+        where = "granularity = ? AND bucket >= ? AND bucket < ?"
+        args = [granularity, first_bucket, until]
+        if tenant:
+            where += " AND tenant = ?"
+            args.append(tenant)
+        if model:
+            where += " AND model = ?"
+            args.append(model)
+        columns = "".join(f"{field}, " for field in group_by)
+        group = f" GROUP BY {', '.join(group_by)}" if group_by else ""
+
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT {columns}SUM(calls), SUM(errors), SUM(tokens_input), SUM(tokens_output), SUM(cost_usd), "
+            f"SUM(latency_ms_sum), MAX(latency_ms_max) FROM usage_rollups WHERE {where}{group}",
+            args
+        ).fetchall()
+        histograms = {}
+        for row in conn.execute(
+            f"SELECT {columns}slot, SUM(count) FROM usage_latency_hist WHERE {where}"
+            f" GROUP BY {columns}slot",
+            args
+        ):
+            histograms.setdefault(row[:len(group_by)], {})[row[-2]] = row[-1]
+
+        results = []
+        for row in rows:
+            key = row[:len(group_by)]
+            calls, errors, tokens_input, tokens_output, cost_usd, latency_sum, latency_max = row[len(group_by):]
+            if not calls:
+                continue
+            counts = histograms.get(key, {})
+            succeeded = calls - errors
+            results.append({
+                **dict(zip(group_by, key)),
+                "calls": calls,
+                "errors": errors,
+                "tokens_input": tokens_input,
+                "tokens_output": tokens_output,
+                "cost_usd": round(cost_usd, 6),
+                "latency_ms": {
+                    "avg": round(latency_sum / succeeded, 1) if succeeded else None,
+                    "p50": histogram_percentile(counts, 50, latency_max),
+                    "p95": histogram_percentile(counts, 95, latency_max),
+                    "p99": histogram_percentile(counts, 99, latency_max),
+                    "max": round(latency_max, 1) if succeeded else None
+                }
+            })
+        results.sort(key=lambda r: r["cost_usd"], reverse=True)
+        return {
+            "from": first_bucket,
+            "to": until,
+            "granularity": granularity,
+            "group_by": list(group_by),
+            "rows": results
+        }
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped
+        }